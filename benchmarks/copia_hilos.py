@@ -0,0 +1,66 @@
+# Compara shutil.copytree con run_copy_plan de main-3.py con 1, 4 y 8 hilos de copia, en un
+# árbol de muchos archivos pequeños y en otro de pocos archivos grandes.
+# Uso: python benchmarks/copia_hilos.py [directorio]
+# El directorio debe estar en el disco que se quiere medir; por defecto, el temporal del sistema.
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPETICIONES = 5
+HILOS = (1, 4, 8)
+
+def cargar_main3():
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main-3.py')
+    spec = importlib.util.spec_from_file_location('main3', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def crear_arbol(ruta, carpetas, archivos_por_carpeta, tamaño):
+    bloque = os.urandom(min(tamaño, 1024 * 1024))
+    for carpeta in range(carpetas):
+        ruta_carpeta = os.path.join(ruta, f'carpeta_{carpeta:03d}')
+        os.makedirs(ruta_carpeta)
+        for archivo in range(archivos_por_carpeta):
+            with open(os.path.join(ruta_carpeta, f'archivo_{archivo:05d}'), 'wb') as f:
+                for _ in range(tamaño // len(bloque)):
+                    f.write(bloque)
+
+def medir(funcion, destino):
+    mejor = float('inf')
+    for _ in range(REPETICIONES):
+        shutil.rmtree(destino, ignore_errors=True)
+        os.sync()
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    shutil.rmtree(destino, ignore_errors=True)
+    return mejor
+
+def main():
+    main3 = cargar_main3()
+    base = sys.argv[1] if len(sys.argv) > 1 else None
+    arboles = [
+        ('20000 archivos de 4 KiB en 20 carpetas', 20, 1000, 4 * 1024),
+        ('4 archivos de 256 MiB', 1, 4, 256 * 1024 * 1024),
+    ]
+    with tempfile.TemporaryDirectory(dir=base) as temporal:
+        destino = os.path.join(temporal, 'copia')
+        print(f"Mejor de {REPETICIONES}, {os.cpu_count()} CPU, "
+              f"default_copy_workers={main3.default_copy_workers(temporal)}")
+        for descripcion, carpetas, archivos, tamaño in arboles:
+            origen = os.path.join(temporal, 'origen')
+            crear_arbol(origen, carpetas, archivos, tamaño)
+            print(descripcion)
+            print(f"  shutil.copytree  {medir(lambda: shutil.copytree(origen, destino), destino):.2f} s")
+            for hilos in HILOS:
+                copiar = lambda: main3.run_copy_plan(main3.plan_copy(origen, destino), main3.CopyProgress(0),
+                                                     lambda: False, hilos)
+                print(f"  workers={hilos:<8} {medir(copiar, destino):.2f} s")
+            shutil.rmtree(origen)
+
+if __name__ == '__main__':
+    main()
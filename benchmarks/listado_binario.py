@@ -0,0 +1,199 @@
+# Compara el listado de un directorio del Arduino en formato de texto (antes) y con el
+# protocolo binario de tramas con CRC (ahora, main_arduino.py).
+# Uso: python benchmarks/listado_binario.py [entradas] [fracción de tramas dañadas]
+# Mide la decodificación en el host, calcula el caudal del enlace a BAUDIOS y recibe el listado
+# a través de FramedSerial desde un dispositivo simulado que daña tramas y antepone basura.
+import importlib.util
+import os
+import random
+import sys
+import threading
+import time
+
+REPETICIONES = 5
+BAUDIOS = 9600
+BITS_POR_BYTE = 10  # 8N1: bit de inicio, 8 de datos y bit de parada
+ESPERA_ACK_SEGUNDOS = 0.005  # Ida y vuelta de la confirmación de cada trama
+SEMILLA = 1234
+
+def cargar_main_arduino():
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main_arduino.py')
+    spec = importlib.util.spec_from_file_location('main_arduino', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def crear_entradas(cantidad):
+    # (es_carpeta, nombre, tamaño, mtime), con nombres y tamaños variados como en una tarjeta SD
+    aleatorio = random.Random(SEMILLA)
+    entradas = []
+    for i in range(cantidad):
+        if i % 10 == 0:
+            entradas.append((True, f'carpeta_{i:04d}', 0, 1700000000 + i * 61))
+        else:
+            nombre = f'registro_{i:04d}_{"x" * aleatorio.randint(0, 12)}.csv'
+            entradas.append((False, nombre, aleatorio.randint(0, 2 ** 24), 1700000000 + i * 61))
+    return entradas
+
+def codificar_texto(entradas):
+    # Formato de texto 'tipo,nombre,tamaño,fecha' con la línea de estado y la marca de fin
+    lineas = [f"{'DIR' if es_carpeta else 'FILE'},{nombre},{tamaño},"
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(mtime))}\n"
+              for es_carpeta, nombre, tamaño, mtime in entradas]
+    return (''.join(lineas) + 'OK\nEND\n').encode()
+
+class PuertoEnMemoria:
+    # Lo justo de serial.Serial para read_frame
+    def __init__(self, datos):
+        self.datos = datos
+        self.posicion = 0
+
+    def read(self, cantidad=1):
+        trozo = self.datos[self.posicion:self.posicion + cantidad]
+        self.posicion += len(trozo)
+        return trozo
+
+def decodificar_texto(ma, datos):
+    lineas = datos.decode().splitlines()[:-2]  # Sin 'OK' ni 'END'
+    return [ma.parse_text_entry(linea) for linea in lineas]
+
+def decodificar_binario(ma, datos):
+    puerto = PuertoEnMemoria(datos)
+    entradas = []
+    while puerto.read(1):  # FRAME_SYNC, que en el programa lee el hilo lector
+        tipo, _, carga = ma.read_frame(puerto, float('inf'))
+        if tipo == ma.FRAME_ENTRIES:
+            entradas.extend(ma.decode_entries(carga))
+    return entradas
+
+def medir(funcion):
+    mejor = float('inf')
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def segundos_enlace(bytes_enviados, tramas=0):
+    return bytes_enviados * BITS_POR_BYTE / BAUDIOS + tramas * ESPERA_ACK_SEGUNDOS
+
+class DispositivoSimulado:
+    # Firmware con protocolo binario al otro lado del puerto: responde a 'proto' y a 'blist'
+    # con las tramas de 'entradas', de una en una tras cada ACK y repitiendo la actual tras un NAK.
+    # Con probabilidad 'fraccion_dañada' cambia un byte de la carga o del CRC de una trama, y con la
+    # misma probabilidad antepone unos bytes de basura a la trama. Sin esperas reales: cuenta los
+    # bytes enviados para calcular el tiempo de enlace.
+    def __init__(self, ma, entradas, fraccion_dañada):
+        self.ma = ma
+        self.tramas = ma.encode_listing_frames(entradas)
+        self.fraccion_dañada = fraccion_dañada
+        self.aleatorio = random.Random(SEMILLA)
+        self.salida = bytearray()
+        self.condicion = threading.Condition()
+        self.timeout = None
+        self.actual = None
+        self.bytes_enviados = 0
+        self.tramas_enviadas = 0
+        self.tramas_dañadas = 0
+        self.basura_enviada = 0
+
+    def write(self, datos):
+        with self.condicion:
+            if datos == self.ma.FRAME_ACK:
+                if self.actual is not None and self.actual + 1 < len(self.tramas):
+                    self.enviar_trama(self.actual + 1)
+                else:
+                    self.actual = None  # Listado terminado
+            elif datos == self.ma.FRAME_NAK:
+                if self.actual is not None:
+                    self.enviar_trama(self.actual)
+            else:
+                linea = datos.decode().strip()
+                if linea == 'proto':
+                    self.enviar(f"BIN {self.ma.BINARY_PROTOCOL_VERSION}\nOK\nEND\n".encode())
+                elif linea.startswith('blist'):
+                    self.enviar_trama(0)
+            self.condicion.notify_all()
+        return len(datos)
+
+    def enviar(self, datos):
+        self.salida += datos
+        self.bytes_enviados += len(datos)
+
+    def enviar_trama(self, indice):
+        self.actual = indice
+        trama = bytearray(self.tramas[indice])
+        if self.aleatorio.random() < self.fraccion_dañada:
+            # Basura sin FRAME_SYNC, a veces con un salto de línea, en la misma «línea» que la trama
+            basura = bytes(self.aleatorio.choice(b'abc\r\n\x00\xff') for _ in range(self.aleatorio.randint(1, 8)))
+            self.enviar(basura)
+            self.basura_enviada += 1
+        if self.aleatorio.random() < self.fraccion_dañada:
+            # Solo carga o CRC: una longitud dañada haría esperar al lector hasta FRAME_TIMEOUT_SECONDS
+            posicion = self.aleatorio.randrange(self.ma.FRAME_HEADER.size, len(trama))
+            trama[posicion] ^= 1 << self.aleatorio.randrange(8)
+            self.tramas_dañadas += 1
+        self.enviar(bytes(trama))
+        self.tramas_enviadas += 1
+
+    def read(self, cantidad=1):
+        with self.condicion:
+            if not self.salida:
+                self.condicion.wait(self.timeout)
+            trozo = bytes(self.salida[:cantidad])
+            del self.salida[:cantidad]
+            return trozo
+
+    def readline(self):
+        linea = b''
+        while not linea.endswith(b'\n'):
+            byte = self.read(1)
+            if not byte:
+                break
+            linea += byte
+        return linea
+
+def recibir_con_errores(ma, entradas, fraccion_dañada):
+    dispositivo = DispositivoSimulado(ma, entradas, fraccion_dañada)
+    arduino = ma.FramedSerial(dispositivo)
+    inicio = time.perf_counter()
+    recibidas = arduino.list_directory('/')
+    duracion = time.perf_counter() - inicio
+    esperadas = [('DIR' if es_carpeta else 'FILE', nombre, str(tamaño),
+                  time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(mtime)))
+                 for es_carpeta, nombre, tamaño, mtime in entradas]
+    return dispositivo, recibidas == esperadas, duracion
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    fraccion_dañada = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    ma = cargar_main_arduino()
+    entradas = crear_entradas(cantidad)
+    texto = codificar_texto(entradas)
+    tramas = ma.encode_listing_frames(entradas)
+    binario = b''.join(tramas)
+    assert len(decodificar_texto(ma, texto)) == cantidad
+    assert decodificar_binario(ma, binario) == entradas
+
+    print(f"{cantidad} entradas, enlace a {BAUDIOS} baudios, mejor de {REPETICIONES}")
+    print("Decodificación en el host:")
+    for nombre, funcion, datos in (('texto', decodificar_texto, texto), ('binario', decodificar_binario, binario)):
+        segundos = medir(lambda: funcion(ma, datos))
+        print(f"  {nombre:8} {segundos * 1000:8.2f} ms  {cantidad / segundos:10.0f} entradas/s")
+    print("Enlace:")
+    segundos_texto = segundos_enlace(len(texto))
+    print(f"  texto    {len(texto):6} bytes             {cantidad / segundos_texto:6.1f} entradas/s")
+    segundos_binario = segundos_enlace(len(binario), len(tramas))
+    print(f"  binario  {len(binario):6} bytes, {len(tramas):4} tramas {cantidad / segundos_binario:6.1f} entradas/s"
+          f" (con {ESPERA_ACK_SEGUNDOS * 1000:.0f} ms de ACK por trama)")
+
+    print(f"Listado con {fraccion_dañada:.0%} de tramas dañadas y con basura delante:")
+    dispositivo, intacto, duracion = recibir_con_errores(ma, entradas, fraccion_dañada)
+    segundos = segundos_enlace(dispositivo.bytes_enviados, dispositivo.tramas_enviadas)
+    print(f"  {dispositivo.tramas_enviadas} tramas enviadas para {len(tramas)}: {dispositivo.tramas_dañadas} dañadas,"
+          f" {dispositivo.basura_enviada} con basura delante")
+    print(f"  listado {'íntegro' if intacto else 'INCORRECTO'}, {dispositivo.bytes_enviados} bytes,"
+          f" {cantidad / segundos:.1f} entradas/s en el enlace ({duracion:.2f} s de simulación)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Compara el listado de un directorio grande con getsize + getmtime por entrada (antes)
+# y con una sola llamada a DirEntry.stat() (make_directory_entry de main-3.py).
+# Uso: python benchmarks/listado_stat.py [entradas] [directorio]
+# Si strace está instalado, cuenta además las llamadas al sistema de la familia stat.
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPETICIONES = 3
+
+def cargar_main3():
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main-3.py')
+    spec = importlib.util.spec_from_file_location('main3', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def listar_antes(ruta, main3):
+    # Mismo resultado que make_directory_entry, con una llamada por dato como antes
+    filas = []
+    with os.scandir(ruta) as it:
+        for entry in it:
+            is_dir = entry.is_dir()
+            size = 0 if is_dir else os.path.getsize(entry.path)
+            filas.append(main3.DirectoryEntry(entry.name, entry.path, is_dir, size, os.path.getmtime(entry.path),
+                                              None, main3.natural_key(entry.name)))
+    return filas
+
+def listar_ahora(ruta, main3):
+    with os.scandir(ruta) as it:
+        return [main3.make_directory_entry(entry) for entry in it]
+
+def crear_directorio(base, entradas):
+    ruta = os.path.join(base, 'listado')
+    os.makedirs(ruta, exist_ok=True)
+    for i in range(entradas):
+        open(os.path.join(ruta, f'archivo_{i:06d}.txt'), 'w').close()
+    return ruta
+
+def medir(funcion):
+    mejor = float('inf')
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--modo':
+        # Una sola pasada, para contarla con strace
+        modo, ruta = sys.argv[2], sys.argv[3]
+        main3 = cargar_main3()
+        listar_antes(ruta, main3) if modo == 'antes' else listar_ahora(ruta, main3)
+        return
+    entradas = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    base = sys.argv[2] if len(sys.argv) > 2 else ('/dev/shm' if os.path.isdir('/dev/shm') else None)
+    main3 = cargar_main3()
+    with tempfile.TemporaryDirectory(dir=base) as temporal:
+        ruta = crear_directorio(temporal, entradas)
+        print(f"{entradas} entradas en {ruta}, mejor de {REPETICIONES}")
+        print(f"  getsize + getmtime: {medir(lambda: listar_antes(ruta, main3)) * 1000:.0f} ms")
+        print(f"  DirEntry.stat():    {medir(lambda: listar_ahora(ruta, main3)) * 1000:.0f} ms")
+        if shutil.which('strace'):
+            for modo in ('antes', 'ahora'):
+                print(f"Llamadas stat ({modo}):")
+                subprocess.run(['strace', '-f', '-c', '-e', 'trace=%stat', sys.executable, os.path.abspath(__file__),
+                                '--modo', modo, ruta])
+        else:
+            print("strace no está instalado: no se cuentan las llamadas al sistema")
+
+if __name__ == '__main__':
+    main()
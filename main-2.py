@@ -1,9 +1,51 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, Menu, Frame, Label, Toplevel
 import os
+import stat
 import time
 import shutil
-from threading import Thread
+import queue
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+
+SCAN_WORKERS = 4  # Hilos para leer directorios sin bloquear la interfaz
+SCAN_BATCH_SIZE = 500  # Entradas que se envían a la interfaz en cada lote
+SCAN_FLUSH_SECONDS = 0.1  # Tiempo máximo que un lote incompleto espera antes de enviarse
+SCAN_POLL_MS = 30  # Intervalo con el que la interfaz recoge los lotes
+UI_DISPATCH_MS = 16  # Cada cuánto aplica la interfaz las actualizaciones de los hilos (~60 por segundo)
+UI_DISPATCH_MAX_CALLS = 100  # Llamadas como máximo por ciclo, para no bloquear el bucle de eventos
+
+class UiDispatcher:
+    # Tkinter solo puede usarse desde el hilo principal: los hilos de trabajo encolan llamadas
+    # con post() y el hilo principal las ejecuta por lotes con after().
+    def __init__(self, root):
+        self.root = root
+        self.calls = queue.Queue()
+
+    def post(self, function, *args):
+        self.calls.put((function, args))
+
+    def start(self):
+        self.root.after(UI_DISPATCH_MS, self.drain)
+
+    def drain(self):
+        self.root.after(UI_DISPATCH_MS, self.drain)  # Se reprograma antes, por si una llamada falla
+        batch = []
+        while len(batch) < UI_DISPATCH_MAX_CALLS:
+            try:
+                call = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            # Varias peticiones iguales en un mismo ciclo se aplican una sola vez, en la posición de
+            # la última: así siguen a cualquier otra llamada encolada entre medias
+            if call in batch:
+                batch.remove(call)
+            batch.append(call)
+        for function, args in batch:
+            try:
+                function(*args)
+            except Exception as e:
+                self.root.report_callback_exception(type(e), e, e.__traceback__)
 
 class FileManager(tk.Tk):
     def __init__(self):
@@ -17,14 +59,24 @@ class FileManager(tk.Tk):
         self.sort_column = "name"
         self.reverse_sort = False
         self.view_mode = 'details'  # 'details' or 'grid'
+        self.entries = []
+        self.scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        self.scan_queue = queue.Queue()
+        self.scan_generation = 0  # Cambia en cada escaneo; los escaneos antiguos se descartan
         
         self.clipboard_action = None
         self.clipboard_path = None
+        self.operation_queue = queue.Queue()  # Operaciones de archivos pendientes, en orden
+        self.pending_operations = 0  # Encoladas o en curso; la ventana de progreso se cierra al llegar a 0
+        self.operation_lock = Lock()
+        self.ui = UiDispatcher(self)  # Las actualizaciones de la interfaz desde otros hilos pasan por aquí
+        Thread(target=self.run_operations, daemon=True).start()
 
         self.setup_toolbar()
         self.setup_views()
 
         self.refresh()
+        self.ui.start()  # Aplica las actualizaciones enviadas por los hilos de trabajo
 
     def setup_toolbar(self):
         self.toolbar = tk.Frame(self, bd=1, relief=tk.RAISED)
@@ -111,18 +163,60 @@ class FileManager(tk.Tk):
             self.display_grid_view()
 
     def load_directory_contents(self, path):
-        items = []
-        for entry in os.scandir(path):
-            size = '<DIR>' if entry.is_dir() else f'{os.path.getsize(entry.path)} bytes'
-            mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(entry.path)))
-            items.append((entry.name, size, mod_time, entry.path))
-        
-        sorted_items = self.bubble_sort(items, self.sort_column, self.reverse_sort)
+        self.scan_generation += 1  # Cancela cualquier escaneo anterior que siga en curso
+        generation = self.scan_generation
+        self.entries = []
+        self.tree.delete(*self.tree.get_children())
+        self.scan_executor.submit(self.scan_directory, path, generation)
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
+
+    def scan_directory(self, path, generation):
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if generation != self.scan_generation:
+                        return  # El usuario ya navegó a otro directorio
+                    try:
+                        st = entry.stat()  # Una sola llamada en lugar de getsize + getmtime
+                        size = '<DIR>' if stat.S_ISDIR(st.st_mode) else f'{st.st_size} bytes'
+                        mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st.st_mtime))
+                    except OSError:
+                        continue  # La entrada desapareció o es un enlace roto
+                    batch.append((entry.name, size, mod_time, entry.path))
+                    # Envía lotes llenos, o lo que haya si el disco es lento
+                    if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_flush > SCAN_FLUSH_SECONDS:
+                        self.scan_queue.put((generation, batch, False, None))
+                        batch = []
+                        last_flush = time.monotonic()
+        except OSError as e:
+            self.scan_queue.put((generation, batch, True, e))
+            return
+        self.scan_queue.put((generation, batch, True, None))
 
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for entry in sorted_items:
-            self.tree.insert('', 'end', iid=entry[3], text=entry[0], values=(entry[1], entry[2]))
+    def process_scan_queue(self, generation):
+        if generation != self.scan_generation:
+            return  # Hay un escaneo más reciente con su propio sondeo
+        while True:
+            try:
+                batch_generation, batch, finished, error = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch_generation != self.scan_generation:
+                continue
+            self.entries.extend(batch)
+            for entry in batch:  # Listado parcial mientras el escaneo continúa
+                self.tree.insert('', 'end', iid=entry[3], text=entry[0], values=(entry[1], entry[2]))
+            if finished:
+                if error:
+                    messagebox.showerror("Error", f"Error al leer el directorio: {error}")
+                sorted_items = self.bubble_sort(self.entries, self.sort_column, self.reverse_sort)
+                self.tree.delete(*self.tree.get_children())
+                for entry in sorted_items:
+                    self.tree.insert('', 'end', iid=entry[3], text=entry[0], values=(entry[1], entry[2]))
+                return
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
 
     def bubble_sort(self, items, column, reverse):
         n = len(items)
@@ -195,40 +289,33 @@ class FileManager(tk.Tk):
         old_name = self.tree.item(item, 'text')
         new_name = simpledialog.askstring("Renombrar", "Nuevo nombre:", initialvalue=old_name)
         if new_name and new_name != old_name:
-            self.show_progress_window()
-            Thread(target=self.delayed_rename, args=(old_name, new_name)).start()
+            # Las rutas se resuelven al encolar, por si el usuario navega antes de que se ejecute
+            self.enqueue_operation(self.delayed_rename, os.path.join(self.current_path, old_name),
+                                   os.path.join(self.current_path, new_name))
 
-    def delayed_rename(self, old_name, new_name):
-        time.sleep(2)  # Añadir un retraso de 2 segundos
+    def delayed_rename(self, old_path, new_path):
         try:
-            os.rename(os.path.join(self.current_path, old_name), os.path.join(self.current_path, new_name))
-            self.refresh()
+            os.rename(old_path, new_path)
+            self.ui.post(self.refresh)
         except Exception as e:
-            messagebox.showerror("Error", f"Error al renombrar: {e}")
-        finally:
-            self.progress_window.destroy()
+            self.ui.post(messagebox.showerror, "Error", f"Error al renombrar: {e}")
 
     def delete(self):
         item = self.tree.selection()[0]
         name = self.tree.item(item, 'text')
         response = messagebox.askyesno("Eliminar", "¿Estás seguro de querer eliminar esto?")
         if response:
-            self.show_progress_window()
-            Thread(target=self.delayed_delete, args=(name,)).start()
+            self.enqueue_operation(self.delayed_delete, os.path.join(self.current_path, name))
 
-    def delayed_delete(self, name):
-        time.sleep(2)  # Añadir un retraso de 2 segundos
+    def delayed_delete(self, path):
         try:
-            path = os.path.join(self.current_path, name)
             if os.path.isdir(path):
                 shutil.rmtree(path)
             else:
                 os.remove(path)
-            self.refresh()
+            self.ui.post(self.refresh)
         except Exception as e:
-            messagebox.showerror("Error", f"Error al eliminar: {e}")
-        finally:
-            self.progress_window.destroy()
+            self.ui.post(messagebox.showerror, "Error", f"Error al eliminar: {e}")
 
     def copy(self):
         item = self.tree.selection()[0]
@@ -243,28 +330,50 @@ class FileManager(tk.Tk):
     def paste(self):
         if not self.clipboard_path:
             return
-        self.show_progress_window()
-        Thread(target=self.delayed_paste).start()
+        # El portapapeles y el destino se leen ahora: una operación encolada no debe ver cambios posteriores
+        self.enqueue_operation(self.delayed_paste, self.clipboard_path, self.clipboard_action, self.current_path)
 
-    def delayed_paste(self):
-        time.sleep(2)  # Añadir un retraso de 2 segundos
-        src_path = self.clipboard_path
-        dest_path = os.path.join(self.current_path, os.path.basename(src_path))
+    def delayed_paste(self, src_path, clipboard_action, dest_dir):
+        dest_path = os.path.join(dest_dir, os.path.basename(src_path))
         try:
-            if self.clipboard_action == 'copy':
+            if clipboard_action == 'copy':
                 if os.path.isdir(src_path):
                     shutil.copytree(src_path, dest_path)
                 else:
                     shutil.copy2(src_path, dest_path)
-            elif self.clipboard_action == 'cut':
+            elif clipboard_action == 'cut':
                 shutil.move(src_path, dest_path)
-                self.clipboard_path = None
-                self.clipboard_action = None
-            self.refresh()
+                if self.clipboard_path == src_path:
+                    self.clipboard_path = None
+                    self.clipboard_action = None
+            self.ui.post(self.refresh)
         except Exception as e:
-            messagebox.showerror("Error", f"Error al pegar el archivo o carpeta: {e}")
-        finally:
-            self.progress_window.destroy()
+            self.ui.post(messagebox.showerror, "Error", f"Error al pegar el archivo o carpeta: {e}")
+
+    def enqueue_operation(self, operation, *args):
+        with self.operation_lock:
+            self.pending_operations += 1
+            first = self.pending_operations == 1
+        if first:
+            self.show_progress_window()
+        self.operation_queue.put((operation, args))
+
+    def run_operations(self):
+        # Ejecuta las operaciones una tras otra, sin pausas fijas entre ellas
+        while True:
+            operation, args = self.operation_queue.get()
+            try:
+                operation(*args)
+            except Exception as e:
+                # Un error inesperado no debe detener la cola de operaciones
+                self.ui.post(messagebox.showerror, "Error", f"Error en la operación: {e}")
+            finally:
+                with self.operation_lock:
+                    self.pending_operations -= 1
+                    # Se toma la referencia aquí: una operación nueva puede abrir otra ventana enseguida
+                    window = self.progress_window if self.pending_operations == 0 else None
+                if window is not None:
+                    self.ui.post(window.destroy)
 
     def show_progress_window(self):
         self.progress_window = Toplevel(self)
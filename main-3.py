@@ -1,10 +1,1257 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, Menu, Frame, Label, Toplevel
 import os
+import re
+import stat
 import time
 import shutil
-from threading import Thread
+import queue
+import select
+import ctypes
+import ctypes.util
+import errno
+import json
+import struct
+from collections import namedtuple, OrderedDict, deque
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from threading import Thread, Lock, Event, get_native_id
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import serial
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None  # Algunas compilaciones de Python no lo incluyen: se trabaja sin índice persistente
+
+SCAN_WORKERS = 4  # Hilos para leer directorios sin bloquear la interfaz
+SCAN_BATCH_SIZE = 500  # Entradas que se envían a la interfaz en cada lote
+SCAN_FLUSH_SECONDS = 0.1  # Tiempo máximo que un lote incompleto espera antes de enviarse
+SCAN_POLL_MS = 30  # Intervalo con el que la interfaz recoge los lotes
+VIRTUAL_OVERSCAN = 5  # Filas extra que se materializan bajo la parte visible
+WHEEL_SCROLL_ROWS = 3  # Filas que avanza cada paso de la rueda del ratón
+GRID_TILE_WIDTH = 180  # Tamaño fijo de cada mosaico de la vista de cuadrícula
+GRID_TILE_HEIGHT = 60
+COPY_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes por bloque; la cancelación se revisa entre bloques
+COPY_WORKERS_NETWORK = 8  # En red domina la latencia por archivo: muchas copias simultáneas la ocultan
+COPY_WORKERS_SSD = 8  # En discos locales sin partes móviles, limitado además por el número de CPU
+COPY_WORKERS_HDD = 2  # En discos giratorios más hilos solo añaden desplazamientos del cabezal
+# Tipos de /proc/self/mountinfo que reciben COPY_WORKERS_NETWORK
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs', '9p', 'ceph', 'glusterfs',
+                       'lustre', 'fuse.sshfs', 'fuse.rclone', 'fuse.glusterfs', 'fuse.cephfs'}
+COPY_BATCH_FILES = 64  # Archivos pequeños que copia cada tarea del pool
+OPERATIONS_PER_DEVICE = 2  # Operaciones de archivos simultáneas como máximo sobre un mismo dispositivo
+HARDWARE_CANCEL_WINDOW_SECONDS = 0.5  # Margen mínimo para pulsar el botón de cancelación del Arduino
+SERIAL_REQUEST_TIMEOUT_SECONDS = 1.0  # Una petición al Arduino sin respuesta en este tiempo falla
+SERIAL_READ_TIMEOUT_SECONDS = 0.1  # Cada cuánto revisa el hilo lector las peticiones caducadas
+SERIAL_MAX_REQUEST_ID = 9999  # Los ids de petición vuelven a empezar tras este valor
+SERIAL_PROBE_ATTEMPTS = 3  # Consultas al abrir el puerto para saber si el sketch acepta ids
+PROGRESS_UPDATE_MS = 200  # Intervalo de actualización de la barra de progreso
+FAILURE_REPORT_MAX_ITEMS = 10  # Elementos fallidos que se listan en el informe final de una operación
+DELETE_WORKERS = 4  # Hilos que vacían en paralelo los subdirectorios de una carpeta al eliminarla
+TRASH_DIR_NAME = '.gestor_papelera'  # Papelera en la carpeta personal o en la raíz de cada sistema de archivos
+TRASH_RETENTION_SECONDS = 7 * 24 * 3600  # Tiempo que se conserva un elemento en la papelera antes de purgarlo
+TRASH_PURGE_INTERVAL_SECONDS = 600  # Cada cuánto revisa el hilo de purga los elementos caducados
+# Papeleras creadas en cualquier sistema de archivos, para encontrarlas en las sesiones siguientes
+TRASH_REGISTRY_PATH = os.path.join(os.path.expanduser('~'), TRASH_DIR_NAME, 'papeleras.json')
+# Errores con los que un elemento no puede ir a la papelera y se ofrece eliminarlo permanentemente
+TRASH_UNAVAILABLE_ERRORS = {errno.EXDEV, errno.EACCES, errno.EPERM, errno.EROFS}
+UI_DISPATCH_MS = 16  # Cada cuánto aplica la interfaz las actualizaciones de los hilos (~60 por segundo)
+UI_DISPATCH_MAX_CALLS = 100  # Llamadas como máximo por ciclo, para no bloquear el bucle de eventos
+LISTING_CACHE_MAX_ENTRIES = 200000  # Límite de memoria de la caché de listados, en entradas totales
+# Fuera de la carpeta personal: guardar el índice en un directorio observado provocaría otro escaneo
+METADATA_INDEX_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                   'gestor_archivos', 'indice.db')  # None lo desactiva
+SEARCH_SHARD_ENTRIES = 50000  # Nombres por grupo del índice de búsqueda; un cambio solo reconstruye su grupo
+SEARCH_MAX_RESULTS = 10000  # Resultados de búsqueda que se muestran como máximo
+GREP_WORKERS = 4  # Hilos que buscan en el contenido de los archivos a la vez
+GREP_CHUNK_SIZE = 1024 * 1024  # Bytes que se leen de cada archivo en cada bloque
+GREP_BINARY_SNIFF_BYTES = 8192  # Un byte nulo al principio del archivo lo marca como binario y se omite
+GREP_LINE_MAX_BYTES = 300  # Texto de cada línea coincidente que se muestra
+GREP_MAX_RESULTS = 10000  # Coincidencias tras las que se detiene la búsqueda en el contenido
+DIR_SIZE_WORKERS = 4  # Hilos que recorren en paralelo las ramas de una carpeta al calcular su tamaño
+DIR_SIZE_CACHE_MAX_ENTRIES = 200000  # Directorios recordados por la caché de tamaños
+WATCH_DEBOUNCE_SECONDS = 0.3  # Silencio que se espera tras un cambio antes de actualizar
+WATCH_MAX_DELAY_SECONDS = 2.0  # Con cambios continuos, se actualiza al menos con esta frecuencia
+WATCH_POLL_SECONDS = 1.0  # Intervalo del observador por sondeo cuando no hay inotify
+WATCH_CHECK_MS = 100  # Intervalo con el que la interfaz revisa los cambios pendientes
+
+# Eventos de inotify que indican que el contenido del directorio cambió
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len; le sigue el nombre con len bytes
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+def natural_key(name):
+    # Orden natural: 'archivo2' va antes que 'archivo10', sin distinguir mayúsculas
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name.casefold())]
+
+# Registro compacto por entrada, construido con una sola llamada a stat()
+DirectoryEntry = namedtuple('DirectoryEntry', 'name path is_dir size mtime mode name_key')
+
+def make_directory_entry(entry):
+    st = entry.stat()
+    is_dir = stat.S_ISDIR(st.st_mode)
+    return DirectoryEntry(entry.name, entry.path, is_dir, 0 if is_dir else st.st_size, st.st_mtime, st.st_mode, natural_key(entry.name))
+
+SORT_KEYS = {
+    'name': lambda entry: entry.name_key,
+    'size': lambda entry: entry.size,
+    'modified': lambda entry: entry.mtime,
+}
+
+class ListingCache:
+    # Caché LRU de listados por ruta. Cada listado se valida con el dispositivo, el inodo
+    # y el mtime del directorio, que cambian al crear, borrar o renombrar entradas.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.listings = OrderedDict()  # ruta -> (validador, entradas)
+        self.total_entries = 0
+        self.lock = Lock()  # Se consulta desde los hilos de escaneo
+
+    def get(self, path, validator):
+        with self.lock:
+            cached = self.listings.get(path)
+            if cached is None:
+                return None
+            if cached[0] != validator:
+                self.discard(path)
+                return None
+            self.listings.move_to_end(path)
+            return cached[1]
+
+    def put(self, path, validator, entries):
+        with self.lock:
+            self.discard(path)
+            if len(entries) > self.max_entries:
+                return  # No vale la pena vaciar la caché por un único directorio enorme
+            self.listings[path] = (validator, entries)
+            self.total_entries += len(entries)
+            while self.total_entries > self.max_entries:
+                _, (_, evicted) = self.listings.popitem(last=False)
+                self.total_entries -= len(evicted)
+
+    def discard(self, path):
+        cached = self.listings.pop(path, None)
+        if cached is not None:
+            self.total_entries -= len(cached[1])
+
+def get_directory_validator(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+class MetadataIndex:
+    # Índice persistente en SQLite con el último listado de cada directorio visitado, para pintar
+    # al instante al arrancar. Las escrituras las hace un hilo propio con su conexión; las lecturas
+    # usan otra conexión compartida y, en modo WAL, no esperan a las escrituras.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.reader = sqlite3.connect(db_path, check_same_thread=False)
+        self.reader.execute("PRAGMA journal_mode=WAL")
+        with self.reader:
+            self.reader.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, dev INTEGER, "
+                                "ino INTEGER, mtime_ns INTEGER, scanned REAL)")
+            self.reader.execute("CREATE TABLE IF NOT EXISTS entries (parent TEXT, name TEXT, is_dir INTEGER, "
+                                "size INTEGER, mtime REAL, mode INTEGER, PRIMARY KEY (parent, name)) WITHOUT ROWID")
+        self.read_lock = Lock()
+        self.writes = queue.Queue()
+        Thread(target=self.run_writer, daemon=True).start()
+
+    def load(self, path):
+        # Devuelve (validador, entradas) o None si el directorio no está en el índice
+        try:
+            with self.read_lock:
+                row = self.reader.execute("SELECT dev, ino, mtime_ns FROM directories WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    return None
+                rows = self.reader.execute("SELECT name, is_dir, size, mtime, mode FROM entries WHERE parent = ?",
+                                           (path,)).fetchall()
+        except sqlite3.Error:
+            return None
+        entries = [DirectoryEntry(name, os.path.join(path, name), bool(is_dir), size, mtime, mode, natural_key(name))
+                   for name, is_dir, size, mtime, mode in rows]
+        return tuple(row), entries
+
+    def save(self, path, validator, entries):
+        self.writes.put((path, validator, entries))
+
+    def run_writer(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA synchronous=NORMAL")  # Con WAL basta: el índice se puede reconstruir
+        while True:
+            pending = {}
+            path, validator, entries = self.writes.get()
+            pending[path] = (validator, entries)
+            while True:  # Si se acumularon escrituras del mismo directorio, solo cuenta la última
+                try:
+                    path, validator, entries = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+                pending[path] = (validator, entries)
+            try:
+                with connection:  # Todo lo acumulado en una sola transacción
+                    for path, (validator, entries) in pending.items():
+                        rows = [(entry.name, entry.is_dir, entry.size, entry.mtime, entry.mode) for entry in entries]
+                        if self.is_unchanged(connection, path, validator, rows):
+                            continue  # Sin escrituras no cambia el archivo del índice
+                        connection.execute("DELETE FROM entries WHERE parent = ?", (path,))
+                        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                               [(path, *row) for row in rows])
+                        connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?)",
+                                           (path, *validator, time.time()))
+            except sqlite3.Error:
+                continue  # El índice es solo una aceleración: un fallo no afecta al listado
+
+    def is_unchanged(self, connection, path, validator, rows):
+        saved = connection.execute("SELECT dev, ino, mtime_ns FROM directories WHERE path = ?", (path,)).fetchone()
+        if saved != tuple(validator):
+            return False
+        saved_rows = connection.execute("SELECT name, is_dir, size, mtime, mode FROM entries WHERE parent = ?",
+                                        (path,)).fetchall()
+        return sorted(saved_rows) == sorted((name, int(is_dir), size, mtime, mode) for name, is_dir, size, mtime, mode in rows)
+
+    def own_files(self):
+        # Archivos que escribe el propio índice; sus cambios no son cambios del usuario
+        return {self.db_path + suffix for suffix in ('', '-wal', '-shm', '-journal')}
+
+    def load_tree(self, root):
+        # Todos los listados guardados bajo root, como {directorio: (validador, [(nombre, es_directorio)])}.
+        # Usa su propia conexión para no bloquear las lecturas de la navegación durante la carga.
+        connection = sqlite3.connect(self.db_path)
+        try:
+            prefix = os.path.join(root, '')
+            tree = {path: ((dev, ino, mtime_ns), []) for path, dev, ino, mtime_ns in connection.execute(
+                "SELECT path, dev, ino, mtime_ns FROM directories") if path == root or path.startswith(prefix)}
+            for parent, name, is_dir in connection.execute("SELECT parent, name, is_dir FROM entries"):
+                listing = tree.get(parent)
+                if listing is not None:
+                    listing[1].append((name, bool(is_dir)))
+            return tree
+        finally:
+            connection.close()
+
+def open_metadata_index():
+    if sqlite3 is None or METADATA_INDEX_PATH is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(METADATA_INDEX_PATH), exist_ok=True)
+        return MetadataIndex(METADATA_INDEX_PATH)
+    except (sqlite3.Error, OSError):
+        return None  # Sin índice se escanea como siempre
+
+class FilenameShard:
+    # Un grupo de directorios del índice de nombres. Sus nombres se guardan también en un único
+    # texto en minúsculas, uno por línea, donde str.find y las expresiones regulares buscan a
+    # velocidad de C. Solo se reconstruye el texto de los grupos que cambiaron.
+    def __init__(self):
+        self.directories = {}  # directorio -> nombres
+        self.entry_count = 0
+        self.snapshot = None  # (texto, inicios de línea, directorio por línea, posición por línea, directorios)
+
+    def get_snapshot(self):
+        if self.snapshot is None:
+            directories = list(self.directories.items())
+            names = [name.casefold() for _, dir_names in directories for name in dir_names]
+            blob = '\n' + '\n'.join(names) + '\n'
+            starts = array('q', accumulate((len(name) + 1 for name in names), initial=1))
+            line_dir, line_pos = array('l'), array('l')
+            for index, (_, dir_names) in enumerate(directories):
+                line_dir.extend([index] * len(dir_names))
+                line_pos.extend(range(len(dir_names)))
+            self.snapshot = (blob, starts, line_dir, line_pos, directories)
+        return self.snapshot
+
+class FilenameIndex:
+    # Índice en memoria de los nombres de archivo bajo un directorio, por grupos de directorios
+    def __init__(self):
+        self.shards = []
+        self.locations = {}  # directorio -> grupo que lo contiene
+        self.lock = Lock()
+
+    def update(self, path, names):
+        with self.lock:
+            shard = self.locations.get(path)
+            if shard is None:
+                if not self.shards or self.shards[-1].entry_count >= SEARCH_SHARD_ENTRIES:
+                    self.shards.append(FilenameShard())
+                shard = self.shards[-1]
+                self.locations[path] = shard
+            else:
+                shard.entry_count -= len(shard.directories[path])
+            shard.directories[path] = names
+            shard.entry_count += len(names)
+            shard.snapshot = None
+
+    def remove(self, path):
+        with self.lock:
+            shard = self.locations.pop(path, None)
+            if shard is not None:
+                shard.entry_count -= len(shard.directories.pop(path))
+                shard.snapshot = None
+
+    def search(self, query):
+        # Genera las rutas que coinciden, grupo a grupo: los primeros resultados llegan enseguida
+        query = query.casefold()
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            with self.lock:
+                blob, starts, line_dir, line_pos, directories = shard.get_snapshot()
+            for line in find_matching_lines(blob, starts, query):
+                directory, names = directories[line_dir[line]]
+                yield os.path.join(directory, names[line_pos[line]])
+
+def find_matching_lines(blob, starts, query):
+    # 'texto' busca subcadenas, 'texto*' prefijos y cualquier otro uso de * o ? es un patrón glob
+    if not query.strip('*'):
+        # Solo asteriscos: coinciden todos los nombres. Con re.M, '^[^\n]*$' también encontraría
+        # las líneas vacías del principio y del final del texto, que no son ningún nombre
+        yield from range(len(starts) - 1)
+        return
+    wildcards = query.count('*') + query.count('?')
+    if wildcards == 0 or (wildcards == 1 and query.endswith('*') and len(query) > 1):
+        # Un prefijo es una subcadena precedida del salto de línea que abre cada nombre
+        needle, shift = (query, 0) if wildcards == 0 else ('\n' + query[:-1], 1)
+        position = blob.find(needle)
+        while position != -1:
+            line = bisect_right(starts, position + shift) - 1
+            yield line
+            position = blob.find(needle, starts[line + 1] - shift)  # Una sola coincidencia por línea
+        return
+    pattern = ''.join('[^\n]*' if char == '*' else '[^\n]' if char == '?' else re.escape(char) for char in query)
+    literal = max(re.split(r'[*?]', query), key=len)
+    if len(literal) >= 2:
+        # Solo se prueba el patrón en las líneas que contienen su parte literal más larga;
+        # con un solo carácter casi todas lo contienen y es más rápido recorrer el texto entero
+        regex = re.compile(pattern)
+        for line in find_matching_lines(blob, starts, literal):
+            if regex.fullmatch(blob, starts[line], starts[line + 1] - 1):
+                yield line
+        return
+    for match in re.finditer('^' + pattern + '$', blob, re.M):
+        yield bisect_right(starts, match.start()) - 1
+
+def make_search_result(path, base_path):
+    # Entrada de resultado: el nombre mostrado es la ruta relativa, para saber dónde está
+    st = os.stat(path)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    name = os.path.relpath(path, base_path)
+    return DirectoryEntry(name, path, is_dir, 0 if is_dir else st.st_size, st.st_mtime, st.st_mode, natural_key(name))
+
+class ContentSearchProgress:
+    # Archivos revisados y coincidencias encontradas por una búsqueda en el contenido
+    def __init__(self):
+        self.files = 0
+        self.matches = 0
+        self.start_time = time.monotonic()
+        self.lock = Lock()
+
+    def add(self, files, matches):
+        with self.lock:
+            self.files += files
+            self.matches += matches
+
+    def describe(self):
+        with self.lock:
+            files, matches = self.files, self.matches
+        elapsed = time.monotonic() - self.start_time
+        rate = files / elapsed if elapsed > 0 else 0
+        return f"{files} archivos, {matches} coincidencias ({rate:.0f} archivos/s)"
+
+def iter_files(root, should_stop):
+    # Archivos regulares bajo root, sin seguir enlaces simbólicos
+    pending = [root]
+    while pending and not should_stop():
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path
+            except OSError:
+                continue
+
+def grep_file(path, regex, should_stop):
+    # Lee por bloques (la lectura libera el GIL, así otros hilos buscan mientras tanto) y solo
+    # busca en líneas completas: el resto del bloque pasa al siguiente. Devuelve (línea, texto).
+    # Con un patrón de texto (str) cada bloque se decodifica antes de buscar: IGNORECASE sobre
+    # bytes solo iguala letras ASCII y no encontraría Á/á o Ñ/ñ
+    decode = isinstance(regex.pattern, str)
+    newline = '\n' if decode else b'\n'
+    matches = []
+    line_number = 1
+    carry = b''
+    with open(path, 'rb') as f:
+        chunk = f.read(GREP_CHUNK_SIZE)
+        if b'\0' in chunk[:GREP_BINARY_SNIFF_BYTES]:
+            return matches  # Archivo binario
+        while True:
+            data = carry + chunk
+            cut = data.rfind(b'\n') + 1 if chunk else len(data)
+            if cut == 0 and len(data) > GREP_CHUNK_SIZE * 4:
+                cut = len(data)  # Línea enorme sin saltos: se parte para no acumularla entera en memoria
+            block, carry = data[:cut], data[cut:]
+            if decode:
+                block = block.decode('utf-8', 'replace')  # Bloques de líneas completas: no parten caracteres
+            counted = 0
+            position = 0
+            while position < len(block):
+                match = regex.search(block, position)
+                if match is None:
+                    break
+                start = block.rfind(newline, 0, match.start()) + 1
+                line_number += block.count(newline, counted, start)
+                counted = start
+                end = block.find(newline, match.end())
+                end = len(block) if end == -1 else end
+                text = block[start:end][:GREP_LINE_MAX_BYTES]
+                matches.append((line_number, (text if decode else text.decode('utf-8', 'replace')).strip()))
+                position = end + 1  # Cada línea se informa una sola vez
+            line_number += block.count(newline, counted)
+            if not chunk or should_stop():
+                return matches
+            chunk = f.read(GREP_CHUNK_SIZE)
+
+def search_file_contents(root, regex, progress, should_stop, on_matches, workers=GREP_WORKERS):
+    # Reparte los archivos entre el pool sin encolarlos todos: como mucho unos pocos por hilo
+    def search(path):
+        try:
+            return path, grep_file(path, regex, should_stop)
+        except OSError:
+            return path, []  # Sin permiso o desaparecido: se omite
+
+    def collect(done):
+        for future in done:
+            path, matches = future.result()
+            progress.add(1, len(matches))
+            if matches:
+                on_matches(path, matches)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        for path in iter_files(root, should_stop):
+            if len(in_flight) >= workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(pool.submit(search, path))
+        collect(wait(in_flight)[0])
+
+class DirectorySizeCache:
+    # Caché LRU por directorio con los bytes de sus archivos directos y sus subdirectorios.
+    # El mtime de un directorio solo cambia con sus entradas directas, así que cada nivel se valida
+    # por separado: un recálculo solo vuelve a leer los directorios que cambiaron.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.directories = OrderedDict()  # ruta -> (validador, bytes, subdirectorios)
+        self.lock = Lock()
+
+    def get(self, path, validator):
+        with self.lock:
+            cached = self.directories.get(path)
+            if cached is None or cached[0] != validator:
+                return None
+            self.directories.move_to_end(path)
+            return cached[1], cached[2]
+
+    def put(self, path, validator, files_bytes, subdirs):
+        with self.lock:
+            self.directories[path] = (validator, files_bytes, subdirs)
+            self.directories.move_to_end(path)
+            while len(self.directories) > self.max_entries:
+                self.directories.popitem(last=False)
+
+def scan_directory_size(path, device, cache):
+    validator = get_directory_validator(path)
+    cached = cache.get(path, validator)
+    if cached is not None:
+        return cached
+    files_bytes = 0
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            st = entry.stat(follow_symlinks=False)
+            if stat.S_ISDIR(st.st_mode):
+                if st.st_dev == device:  # Como du -x: no entra en otros sistemas de archivos
+                    subdirs.append(entry.path)
+            else:
+                files_bytes += st.st_size
+    cache.put(path, validator, files_bytes, subdirs)
+    return files_bytes, subdirs
+
+def compute_directory_size(path, pool, cache, should_stop):
+    # Cada subdirectorio es una tarea del pool, así varias ramas se leen a la vez.
+    # Los directorios sin permiso de lectura se omiten. Devuelve None si se detiene.
+    device = os.lstat(path).st_dev
+    total = 0
+    pending = {pool.submit(scan_directory_size, path, device, cache)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if should_stop():
+            for future in pending:
+                future.cancel()
+            return None
+        for future in done:
+            try:
+                files_bytes, subdirs = future.result()
+            except OSError:
+                continue
+            total += files_bytes
+            pending |= {pool.submit(scan_directory_size, subdir, device, cache) for subdir in subdirs}
+    return total
+
+class DirectoryWatcher:
+    # Observa un único directorio y llama a on_change desde su propio hilo.
+    # Usa inotify en Linux y, si no está disponible, compara el mtime del directorio.
+    def __init__(self, on_change, ignored_paths=()):
+        self.on_change = on_change
+        self.ignored_paths = set(ignored_paths)  # Archivos de la propia aplicación
+        self.path = None
+        self.inotify_fd = None
+        self.watch_descriptor = None
+        self.libc = None
+        if hasattr(os, 'O_NONBLOCK'):
+            try:
+                self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                self.inotify_fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (OSError, AttributeError):
+                self.inotify_fd = None
+            if self.inotify_fd is not None and self.inotify_fd < 0:
+                self.inotify_fd = None
+        target = self.read_inotify_events if self.inotify_fd is not None else self.poll_directory_mtime
+        Thread(target=target, daemon=True).start()
+
+    def watch(self, path):
+        self.path = path
+        if self.inotify_fd is None:
+            return
+        if self.watch_descriptor is not None:
+            self.libc.inotify_rm_watch(self.inotify_fd, self.watch_descriptor)
+        self.watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(path), INOTIFY_MASK)
+        if self.watch_descriptor < 0:
+            self.watch_descriptor = None  # Límite de inotify alcanzado o sin permisos
+
+    def read_inotify_events(self):
+        while True:
+            readable, _, _ = select.select([self.inotify_fd], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.inotify_fd, 65536)
+            except BlockingIOError:
+                continue
+            if any(path not in self.ignored_paths for path in self.event_paths(data)):
+                self.on_change()
+
+    def event_paths(self, data):
+        pos = 0
+        while pos + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, pos)
+            name = data[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            pos += INOTIFY_EVENT.size + length
+            path = self.path
+            yield os.path.join(path, os.fsdecode(name)) if path and name else path
+
+    def poll_directory_mtime(self):
+        last_path, last_mtime = None, None
+        while True:
+            time.sleep(WATCH_POLL_SECONDS)
+            path = self.path
+            try:
+                mtime = os.stat(path).st_mtime_ns if path else None
+            except OSError:
+                mtime = None
+            if path == last_path and mtime != last_mtime:
+                self.on_change()
+            last_path, last_mtime = path, mtime
+
+class CopyCancelled(Exception):
+    pass
+
+class CopyProgress:
+    # Bytes copiados frente al total; la actualizan los hilos de copia y la lee la interfaz
+    def __init__(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.start_time = time.monotonic()
+        self.lock = Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.done_bytes += count
+
+    def snapshot(self):
+        with self.lock:
+            done = self.done_bytes
+        elapsed = time.monotonic() - self.start_time
+        return done, self.total_bytes, done / elapsed if elapsed > 0 else 0
+
+    def describe(self):
+        done, total, rate = self.snapshot()
+        mb = 1024 * 1024
+        percent = done * 100 / total if total else 100
+        return f"{percent:.0f}% - {done / mb:.1f} de {total / mb:.1f} MB ({rate / mb:.1f} MB/s)"
+
+class DeleteCancelled(Exception):
+    pass
+
+class DeleteProgress:
+    # Entradas eliminadas. El total no se calcula: contarlo costaría otro recorrido completo del árbol
+    def __init__(self):
+        self.removed = 0
+        self.start_time = time.monotonic()
+        self.lock = Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.removed += count
+
+    def describe(self):
+        with self.lock:
+            removed = self.removed
+        elapsed = time.monotonic() - self.start_time
+        rate = removed / elapsed if elapsed > 0 else 0
+        return f"{removed} eliminados ({rate:.0f}/s)"
+
+def clear_directory(path, progress, should_stop):
+    # Borra todo lo que no es un directorio y devuelve los subdirectorios, que quedan para otras tareas
+    subdirs = []
+    removed = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if should_stop():
+                    raise DeleteCancelled()
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    os.unlink(entry.path)
+                    removed += 1
+                    if removed == SCAN_BATCH_SIZE:
+                        progress.add(removed)
+                        removed = 0
+    finally:
+        progress.add(removed)  # También lo borrado antes de cancelar o fallar
+    return subdirs
+
+def remove_tree(path, progress, is_cancelled, workers=DELETE_WORKERS):
+    # Cada subdirectorio es una tarea del pool, así varios hilos recorren ramas distintas a la vez;
+    # los directorios ya vacíos se eliminan al final, de los más profundos hacia arriba.
+    dirs = [path]
+    failed = Event()
+    should_stop = lambda: failed.is_set() or is_cancelled()
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(clear_directory, path, progress, should_stop)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    failed.set()  # El resto de tareas se detiene en la siguiente entrada
+                    errors.append(error)
+                elif not failed.is_set():
+                    subdirs = future.result()
+                    dirs.extend(subdirs)
+                    pending |= {pool.submit(clear_directory, subdir, progress, should_stop) for subdir in subdirs}
+    real_errors = [error for error in errors if not isinstance(error, DeleteCancelled)]
+    if real_errors:
+        raise real_errors[0]
+    if errors:
+        raise DeleteCancelled()
+    for dir_path in reversed(dirs):  # Cada hijo se añadió después que su padre
+        os.rmdir(dir_path)
+    progress.add(len(dirs))
+
+def find_mount_point(path):
+    # Sube por los directorios padre mientras sigan en el mismo dispositivo
+    path = os.path.abspath(path)
+    device = os.lstat(path).st_dev
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path or os.lstat(parent).st_dev != device:
+            return path
+        path = parent
+
+# Un elemento de la papelera: dónde está guardado y de dónde vino
+TrashItem = namedtuple('TrashItem', 'item_id trash_dir original_path deleted_time')
+
+class Trash:
+    # Papelera por sistema de archivos: mover a ella es un os.rename, instantáneo sea cual sea el
+    # tamaño. Un hilo de baja prioridad elimina en segundo plano lo que caduca o lo que se vacía.
+    # Cada papelera guarda los elementos en files/ y su ubicación original en info/<id>.json.
+    def __init__(self, paths):
+        self.lock = Lock()  # Evita que la purga y la restauración compitan por un mismo elemento
+        self.wake = Event()
+        self.purge_all = False
+        self.registered = self.load_registry()  # Incluye las de sistemas de archivos ahora desmontados
+        for path in (os.path.expanduser('~'), *paths):
+            try:
+                self.registered.add(self.get_trash_dir(path))
+            except OSError:
+                continue
+        # Papeleras de sesiones anteriores
+        self.trash_dirs = {trash_dir for trash_dir in self.registered if os.path.isdir(trash_dir)}
+        Thread(target=self.run_purge, daemon=True).start()
+
+    def load_registry(self):
+        try:
+            with open(TRASH_REGISTRY_PATH, encoding='utf-8') as f:
+                return set(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return set()
+
+    def save_registry(self):
+        # Se escribe aparte y se renombra, así una escritura interrumpida no deja el registro a medias
+        temporary_path = TRASH_REGISTRY_PATH + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(TRASH_REGISTRY_PATH), exist_ok=True)
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(sorted(self.registered), f)
+            os.replace(temporary_path, TRASH_REGISTRY_PATH)
+        except OSError:
+            pass  # Sin registro, esa papelera solo se encuentra si se vuelve a usar
+
+    def get_trash_dir(self, path):
+        device = os.lstat(path).st_dev
+        home = os.path.expanduser('~')
+        # En el sistema de archivos del usuario se usa su carpeta personal, que siempre es escribible
+        root = home if os.stat(home).st_dev == device else find_mount_point(path)
+        return os.path.join(root, TRASH_DIR_NAME)
+
+    def move_to_trash(self, path):
+        trash_dir = self.get_trash_dir(path)
+        for folder in ('files', 'info', 'purging'):
+            os.makedirs(os.path.join(trash_dir, folder), exist_ok=True)
+        item_id = f"{time.time_ns()}-{os.path.basename(path)}"
+        info_path = os.path.join(trash_dir, 'info', item_id + '.json')
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(path), 'deleted': time.time()}, f)
+        try:
+            os.rename(path, os.path.join(trash_dir, 'files', item_id))
+        except OSError:
+            os.remove(info_path)
+            raise
+        with self.lock:
+            self.trash_dirs.add(trash_dir)
+            if trash_dir not in self.registered:
+                self.registered.add(trash_dir)
+                self.save_registry()
+
+    def list_items(self):
+        with self.lock:
+            trash_dirs = list(self.trash_dirs)
+        items = []
+        for trash_dir in trash_dirs:
+            try:
+                names = os.listdir(os.path.join(trash_dir, 'info'))
+            except OSError:
+                continue
+            for name in names:
+                try:
+                    with open(os.path.join(trash_dir, 'info', name), encoding='utf-8') as f:
+                        info = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                items.append(TrashItem(name[:-len('.json')], trash_dir, info['path'], info['deleted']))
+        items.sort(key=lambda item: item.deleted_time, reverse=True)
+        return items
+
+    def restore(self, item):
+        with self.lock:
+            if os.path.lexists(item.original_path):
+                raise FileExistsError(errno.EEXIST, "Ya existe en la ubicación original", item.original_path)
+            os.makedirs(os.path.dirname(item.original_path), exist_ok=True)
+            os.rename(os.path.join(item.trash_dir, 'files', item.item_id), item.original_path)
+            os.remove(os.path.join(item.trash_dir, 'info', item.item_id + '.json'))
+
+    def empty(self):
+        with self.lock:
+            self.purge_all = True
+        self.wake.set()
+
+    def run_purge(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)  # En Linux la prioridad es por hilo
+        except (AttributeError, OSError):
+            pass
+        while True:
+            self.wake.wait(TRASH_PURGE_INTERVAL_SECONDS)
+            self.wake.clear()
+            with self.lock:
+                purge_all = self.purge_all
+                self.purge_all = False
+            cutoff = time.time() - TRASH_RETENTION_SECONDS
+            for item in self.list_items():
+                if purge_all or item.deleted_time < cutoff:
+                    self.claim(item)
+            with self.lock:
+                trash_dirs = list(self.trash_dirs)
+            for trash_dir in trash_dirs:
+                self.purge_claimed(os.path.join(trash_dir, 'purging'))
+
+    def claim(self, item):
+        # Una vez en purging/ el elemento ya no se puede restaurar y su borrado puede tardar lo que haga falta
+        with self.lock:
+            try:
+                os.rename(os.path.join(item.trash_dir, 'files', item.item_id),
+                          os.path.join(item.trash_dir, 'purging', item.item_id))
+                os.remove(os.path.join(item.trash_dir, 'info', item.item_id + '.json'))
+            except OSError:
+                pass  # Ya restaurado o eliminado
+
+    def purge_claimed(self, purging_dir):
+        try:
+            entries = list(os.scandir(purging_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    remove_tree(entry.path, DeleteProgress(), lambda: False, workers=1)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # Se reintenta en la próxima pasada
+
+# Un plan de copia: directorios a crear, archivos con su tamaño y enlaces simbólicos a recrear
+CopyPlan = namedtuple('CopyPlan', 'dirs files links total_bytes')
+
+def plan_copy(src, dest):
+    if not os.path.isdir(src):
+        size = os.stat(src).st_size
+        return CopyPlan([], [(src, dest, size)], [], size)
+    dirs, files, links, total = [(src, dest)], [], [], 0
+    pending = [(src, dest)]
+    while pending:
+        src_dir, dest_dir = pending.pop()
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                target = os.path.join(dest_dir, entry.name)
+                if entry.is_symlink():
+                    links.append((entry.path, target))
+                elif entry.is_dir():
+                    dirs.append((entry.path, target))
+                    pending.append((entry.path, target))
+                else:
+                    size = entry.stat().st_size
+                    files.append((entry.path, target, size))
+                    total += size
+    return CopyPlan(dirs, files, links, total)
+
+def copy_file_range_chunk(src_fd, dest_fd):
+    return os.copy_file_range(src_fd, dest_fd, COPY_CHUNK_SIZE)
+
+def sendfile_chunk(src_fd, dest_fd):
+    return os.sendfile(dest_fd, src_fd, None, COPY_CHUNK_SIZE)
+
+def read_write_chunk(src_fd, dest_fd):
+    data = os.read(src_fd, COPY_CHUNK_SIZE)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dest_fd, view):]
+    return len(data)
+
+# De la más rápida a la más lenta; las copias en el kernel evitan pasar los datos por Python
+COPY_CHUNK_FUNCTIONS = [function for name, function in (('copy_file_range', copy_file_range_chunk),
+                                                        ('sendfile', sendfile_chunk))
+                        if hasattr(os, name)] + [read_write_chunk]
+# Errores con los que se pasa al siguiente método en lugar de fallar
+COPY_FALLBACK_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM, errno.ETXTBSY}
+
+def copy_file_chunked(src, dest, progress, is_cancelled):
+    try:
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            src_fd, dest_fd = fsrc.fileno(), fdst.fileno()
+            for copy_chunk in COPY_CHUNK_FUNCTIONS:
+                try:
+                    while True:
+                        copied = copy_chunk(src_fd, dest_fd)
+                        if not copied:
+                            break
+                        progress.add(copied)
+                        if is_cancelled():
+                            raise CopyCancelled()
+                    break
+                except OSError as e:
+                    # Las posiciones de ambos descriptores ya avanzaron, el siguiente método continúa desde ahí
+                    if e.errno not in COPY_FALLBACK_ERRORS or copy_chunk is read_write_chunk:
+                        raise
+        shutil.copystat(src, dest)
+    except BaseException:
+        try:
+            os.remove(dest)  # No deja archivos a medio copiar
+        except OSError:
+            pass
+        raise
+
+def get_filesystem_type(major, minor):
+    # Tipo del sistema de archivos montado con ese dispositivo; None si no se sabe (fuera de Linux)
+    device = f'{major}:{minor}'
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                fields = line.split()
+                # id, padre, mayor:menor, raíz, punto de montaje, opciones, [campos opcionales], '-', tipo, ...
+                if len(fields) > 2 and fields[2] == device and '-' in fields:
+                    return fields[fields.index('-') + 1]
+    except OSError:
+        pass
+    return None
+
+def default_copy_workers(path):
+    # En Linux el tipo de sistema de archivos del destino dice si es de red; si es local, el
+    # dispositivo de bloque dice si es un disco giratorio. tmpfs, overlay o btrfs no tienen uno
+    local_workers = max(1, min(COPY_WORKERS_SSD, os.cpu_count() or 1))
+    try:
+        device = os.stat(path).st_dev
+        major, minor = os.major(device), os.minor(device)
+    except (OSError, AttributeError):
+        return local_workers  # Sin información del dispositivo (por ejemplo, en Windows)
+    if get_filesystem_type(major, minor) in NETWORK_FILESYSTEMS:
+        return COPY_WORKERS_NETWORK
+    block = f'/sys/dev/block/{major}:{minor}'
+    for queue_dir in (os.path.join(block, 'queue'), os.path.join(block, '..', 'queue')):  # Disco o partición
+        try:
+            with open(os.path.join(queue_dir, 'rotational')) as f:
+                return COPY_WORKERS_HDD if f.read().strip() == '1' else local_workers
+        except OSError:
+            continue
+    return local_workers
+
+def copy_planned_file(src, dest, progress, should_stop):
+    if should_stop():
+        raise CopyCancelled()
+    copy_file_chunked(src, dest, progress, should_stop)
+
+def batch_copy_files(files):
+    # Agrupa archivos pequeños para que cada tarea del pool amortice su coste
+    batch, batch_bytes = [], 0
+    for planned in files:
+        batch.append(planned)
+        batch_bytes += planned[2]
+        if len(batch) >= COPY_BATCH_FILES or batch_bytes >= COPY_CHUNK_SIZE:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+def run_copy_plan(plan, progress, is_cancelled, workers=1):
+    # Primero el esqueleto de directorios, así los archivos se pueden copiar en cualquier orden
+    for _, dest_dir in plan.dirs:
+        os.makedirs(dest_dir, exist_ok=True)
+    if workers > 1 and len(plan.files) > 1:
+        failed = Event()
+        should_stop = lambda: failed.is_set() or is_cancelled()
+
+        def copy_batch(batch):
+            try:
+                for src, dest, _ in batch:
+                    copy_planned_file(src, dest, progress, should_stop)
+            except BaseException:
+                failed.set()  # Detiene al resto de hilos en el siguiente bloque
+                raise
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(copy_batch, batch) for batch in batch_copy_files(plan.files)]
+            errors = [future.exception() for future in futures]
+        # Informa del primer error real; las cancelaciones provocadas por él quedan en segundo plano
+        real_errors = [error for error in errors if error is not None and not isinstance(error, CopyCancelled)]
+        if real_errors:
+            raise real_errors[0]
+        if any(errors):
+            raise CopyCancelled()
+    else:
+        for src, dest, _ in plan.files:
+            copy_planned_file(src, dest, progress, is_cancelled)
+    for src, dest in plan.links:
+        os.symlink(os.readlink(src), dest)
+    for src_dir, dest_dir in reversed(plan.dirs):
+        shutil.copystat(src_dir, dest_dir)  # Al final, para que escribir dentro no cambie los tiempos
+
+def rename_into(src_paths, dest_dir):
+    # Mueve con os.rename lo que está en el mismo sistema de archivos que el destino: es atómico
+    # y cuesta lo mismo sea cual sea el tamaño. Devuelve lo movido, lo que está en otro
+    # dispositivo (hay que copiarlo y borrarlo) y los fallos como pares (ruta, error).
+    moved, cross_device, failures = [], [], []
+    dest_device = os.stat(dest_dir).st_dev
+    for src in src_paths:
+        dest = os.path.join(dest_dir, os.path.basename(src))
+        try:
+            if os.path.abspath(src) == os.path.abspath(dest):
+                moved.append(src)  # Ya está en el destino
+                continue
+            if os.path.lexists(dest):
+                raise FileExistsError(errno.EEXIST, "Ya existe en el destino", dest)
+            if os.lstat(src).st_dev != dest_device:
+                cross_device.append(src)
+                continue
+            os.rename(src, dest)
+            moved.append(src)
+        except OSError as e:
+            if e.errno == errno.EXDEV:  # Mismo st_dev pero distinto montaje, p. ej. bind mounts
+                cross_device.append(src)
+            else:
+                failures.append((src, e))
+    return moved, cross_device, failures
+
+class SerialClient:
+    # Único dueño del puerto serie. Cada petición lleva un id que el Arduino repite en su respuesta
+    # ('<id> <comando>' y '<id> <resultado>'); un hilo lector empareja las respuestas con las
+    # peticiones pendientes y completa su Future, así varias pueden estar en curso a la vez
+    # desde cualquier hilo sin mezclar sus respuestas.
+    # Con el sketch anterior, que solo entiende comandos de un byte, se envían comandos sueltos:
+    # solo 'C' responde, con un byte sin id, y las respuestas completan las consultas por orden.
+    def __init__(self, port):
+        self.port = port
+        self.port.timeout = SERIAL_READ_TIMEOUT_SECONDS  # El lector despierta para caducar peticiones
+        self.lock = Lock()  # Protege la tabla de pendientes y hace atómica cada escritura
+        self.pending = {}  # id -> (Future, instante límite), en orden de envío
+        self.next_id = 1
+        self.tagged = None  # Si el firmware acepta ids; None hasta que el lector lo averigua
+        self.unsent = []  # (comando, Future) pedidos antes de conocer el firmware
+        Thread(target=self.read_responses, daemon=True).start()
+
+    def request(self, command):
+        future = Future()
+        with self.lock:
+            if self.tagged is None:
+                self.unsent.append((command, future))  # Se envía al terminar la negociación
+            else:
+                self.send(command, future)
+        return future
+
+    def send(self, command, future):
+        # Se llama con el lock tomado
+        request_id = self.next_id
+        self.next_id = self.next_id % SERIAL_MAX_REQUEST_ID + 1
+        expects_reply = self.tagged or command == 'C'
+        if expects_reply:
+            # Se registra antes de escribir: la respuesta no puede llegar antes que su entrada
+            self.pending[request_id] = (future, time.monotonic() + SERIAL_REQUEST_TIMEOUT_SECONDS)
+        try:
+            self.port.write(f"{request_id} {command}\n".encode() if self.tagged else command.encode())
+        except serial.SerialException as e:
+            self.pending.pop(request_id, None)
+            future.set_exception(e)
+            return
+        if not expects_reply:
+            future.set_result('OK')  # El sketch anterior no confirma las órdenes
+
+    def negotiate(self):
+        # Consulta el botón con el id 0, que no usa ninguna petición. El sketch actual responde
+        # '0 <estado>' en una línea; el anterior ignora el id y el espacio y responde solo el byte
+        # del estado. El Arduino se reinicia al abrir el puerto y pierde lo que recibe mientras
+        # arranca, así que se repite la consulta; sin ninguna respuesta se supone el sketch actual.
+        tagged = True
+        for _ in range(SERIAL_PROBE_ATTEMPTS):
+            self.port.write(b"0 C\n")
+            reply = b''
+            deadline = time.monotonic() + SERIAL_REQUEST_TIMEOUT_SECONDS
+            while not reply.endswith(b'\n') and time.monotonic() < deadline:
+                reply += self.port.readline()
+            if reply.strip():
+                tagged = reply.endswith(b'\n')
+                break
+        with self.lock:
+            self.tagged = tagged
+            unsent, self.unsent = self.unsent, []
+            for command, future in unsent:
+                self.send(command, future)
+
+    def read_responses(self):
+        try:
+            self.negotiate()
+        except serial.SerialException as e:
+            with self.lock:
+                self.tagged = False  # Las peticiones posteriores fallan al escribir
+                unsent, self.unsent = self.unsent, []
+            for _, future in unsent:
+                future.set_exception(e)
+            return
+        buffer = b''
+        while True:
+            try:
+                buffer += self.port.readline() if self.tagged else self.port.read(1)
+            except serial.SerialException as e:
+                self.fail_pending(e)
+                return
+            if not self.tagged:
+                for result in buffer.decode(errors='replace').strip():
+                    self.dispatch_untagged(result)
+                buffer = b''
+            elif buffer.endswith(b'\n'):  # Si no, readline se cortó por tiempo y la línea sigue llegando
+                self.dispatch(buffer.decode(errors='replace').strip())
+                buffer = b''
+            self.expire_pending()
+
+    def dispatch(self, line):
+        request_id, _, result = line.partition(' ')
+        try:
+            request_id = int(request_id)
+        except ValueError:
+            return  # Ruido en la línea o una respuesta sin id
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+        if entry is not None:
+            entry[0].set_result(result)
+
+    def dispatch_untagged(self, result):
+        # El sketch anterior responde en el orden de las consultas: la más antigua es la respondida
+        with self.lock:
+            entry = self.pending.pop(next(iter(self.pending)), None) if self.pending else None
+        if entry is not None:
+            entry[0].set_result(result)
+
+    def expire_pending(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [request_id for request_id, (_, deadline) in self.pending.items() if deadline < now]
+            futures = [self.pending.pop(request_id)[0] for request_id in expired]
+        for future in futures:
+            future.set_exception(TimeoutError("Sin respuesta del Arduino"))
+
+    def fail_pending(self, error):
+        with self.lock:
+            futures = [future for future, _ in self.pending.values()]
+            self.pending.clear()
+        for future in futures:
+            future.set_exception(error)
+
+class UiDispatcher:
+    # Tkinter solo puede usarse desde el hilo principal: los hilos de trabajo encolan llamadas
+    # con post() y el hilo principal las ejecuta por lotes con after().
+    def __init__(self, root):
+        self.root = root
+        self.calls = queue.Queue()
+
+    def post(self, function, *args):
+        self.calls.put((function, args))
+
+    def start(self):
+        self.root.after(UI_DISPATCH_MS, self.drain)
+
+    def drain(self):
+        self.root.after(UI_DISPATCH_MS, self.drain)  # Se reprograma antes, por si una llamada falla
+        batch = []
+        while len(batch) < UI_DISPATCH_MAX_CALLS:
+            try:
+                call = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            # Varias peticiones iguales en un mismo ciclo se aplican una sola vez, en la posición de
+            # la última: así siguen a cualquier otra llamada encolada entre medias
+            if call in batch:
+                batch.remove(call)
+            batch.append(call)
+        for function, args in batch:
+            try:
+                function(*args)
+            except Exception as e:
+                self.root.report_callback_exception(type(e), e, e.__traceback__)
+
+class Operation:
+    # Una operación de archivos con su propio identificador, estado, progreso y cancelación
+    def __init__(self, operation_id, description, function, args, device):
+        self.operation_id = operation_id
+        self.description = description
+        self.function = function
+        self.args = args
+        self.device = device
+        self.state = 'En espera'
+        self.progress = None  # CopyProgress o DeleteProgress mientras avanza
+        self.cancel_event = Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+class OperationManager:
+    # Ejecuta cada operación en su hilo, con un máximo de operaciones simultáneas por dispositivo.
+    # Las que superan el límite esperan su turno en orden de llegada.
+    def __init__(self, max_per_device, cancel_window, on_error, on_idle):
+        self.max_per_device = max_per_device
+        self.cancel_window = cancel_window
+        self.on_error = on_error
+        self.on_idle = on_idle
+        self.operations = OrderedDict()  # id -> Operation en espera o en curso
+        self.running_per_device = {}
+        self.next_id = 1
+        self.lock = Lock()
+
+    def submit(self, description, function, args, device):
+        with self.lock:
+            operation = Operation(self.next_id, description, function, args, device)
+            self.next_id += 1
+            self.operations[operation.operation_id] = operation
+            self.start_ready_operations()
+        return operation
+
+    def start_ready_operations(self):
+        # Se llama con el cerrojo tomado
+        for operation in self.operations.values():
+            if operation.state != 'En espera':
+                continue
+            running = self.running_per_device.get(operation.device, 0)
+            if running >= self.max_per_device:
+                continue
+            self.running_per_device[operation.device] = running + 1
+            operation.state = 'En curso'
+            Thread(target=self.run, args=(operation,), daemon=True).start()
+
+    def run(self, operation):
+        # Margen para el botón de cancelación; termina antes si se cancela
+        deadline = time.monotonic() + self.cancel_window
+        while time.monotonic() < deadline and not operation.is_cancelled():
+            time.sleep(0.05)
+        try:
+            if not operation.is_cancelled():
+                operation.function(operation, *operation.args)
+        except Exception as e:
+            self.on_error(operation, e)
+        finally:
+            with self.lock:
+                self.running_per_device[operation.device] -= 1
+                del self.operations[operation.operation_id]
+                self.start_ready_operations()
+                idle = not self.operations
+            if idle:
+                self.on_idle()
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.operations.values())
+
+    def is_busy(self):
+        with self.lock:
+            return any(operation.state == 'En curso' for operation in self.operations.values())
+
+    def cancel(self, operation_id):
+        with self.lock:
+            operation = self.operations.get(operation_id)
+        if operation is not None:
+            operation.cancel()
+
+    def cancel_running(self):
+        # Devuelve cuántas operaciones en curso se cancelaron ahora
+        with self.lock:
+            running = [operation for operation in self.operations.values()
+                       if operation.state == 'En curso' and not operation.is_cancelled()]
+        for operation in running:
+            operation.cancel()
+        return len(running)
 
 class FileManager(tk.Tk):
     def __init__(self):
@@ -18,14 +1265,57 @@ class FileManager(tk.Tk):
         self.history = []
         self.sort_column = "name"
         self.reverse_sort = False
+        self.entries = []  # DirectoryEntry del directorio actual, compartidas por ambas vistas
+        self.sort_cache = {}  # columna -> entradas ordenadas de forma ascendente
+        self.visible_entries = []  # Entradas en el orden mostrado; el Treeview solo tiene las visibles
+        self.entry_index = {}  # ruta -> posición en visible_entries
+        self.view_offset = 0  # Índice de la primera fila visible
+        self.selected_paths = set()  # Selección, aunque las filas ya no estén materializadas
+        self.extend_selection = False  # El último clic llevaba Ctrl o Mayúsculas
+        self.rendered_rows = []  # Entradas materializadas ahora mismo en el Treeview, en orden
+        self.listed_path = None  # Directorio al que corresponde self.entries
+        self.scanned_entries = []  # Entradas del escaneo en curso
+        self.scan_in_progress = False
+        self.listing_cache = ListingCache(LISTING_CACHE_MAX_ENTRIES)
+        self.metadata_index = open_metadata_index()
+        self.filename_index = FilenameIndex()
+        self.search_active = False  # La vista muestra resultados de búsqueda en lugar de un directorio
+        self.search_generation = 0  # Cambia en cada búsqueda; los resultados antiguos se descartan
+        self.content_search_window = None
+        self.content_search_operation = None  # Búsqueda en el contenido en curso, para cancelarla
+        self.content_search_generation = 0
+        Thread(target=self.crawl_filenames, daemon=True).start()
+        self.first_change_time = None  # Primer cambio externo aún sin aplicar
+        self.last_change_time = None  # Último cambio externo recibido
+        self.watcher = DirectoryWatcher(self.on_directory_changed,
+                                        self.metadata_index.own_files() if self.metadata_index is not None else ())
+        self.scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        self.scan_queue = queue.Queue()
+        self.scan_generation = 0  # Cambia en cada escaneo; los escaneos antiguos se descartan
+        self.dir_sizes = {}  # Tamaño recursivo de las carpetas del directorio actual ya calculadas
+        self.dir_sizes_pending = set()  # Carpetas cuyo tamaño se está calculando
+        self.size_generation = 0  # Cambia al navegar; los cálculos del directorio anterior se descartan
+        self.size_cache = DirectorySizeCache(DIR_SIZE_CACHE_MAX_ENTRIES)
+        self.size_executor = ThreadPoolExecutor(max_workers=DIR_SIZE_WORKERS)
         self.view_mode = 'details'  # 'details' or 'grid'
         
         self.clipboard_action = None
-        self.clipboard_path = None
-        self.operation_in_progress = False
-        self.cancel_operation = False
+        self.clipboard_paths = []
+        self.copy_workers = None  # Hilos para copiar carpetas; None elige según el disco de destino
+        self.operations_window = None
+        self.ui = UiDispatcher(self)  # Las actualizaciones de la interfaz desde otros hilos pasan por aquí
+        self.trash = Trash([self.current_path])
+        self.trash_window = None
 
-        self.arduino = serial.Serial('COM9', 9600)  # Cambia 'COM9' al puerto correspondiente
+        try:
+            self.arduino = SerialClient(serial.Serial('COM9', 9600))  # Cambia 'COM9' al puerto correspondiente
+        except serial.SerialException:
+            self.arduino = None  # Sin hardware: las operaciones no esperan al botón de cancelación
+        # Solo con el Arduino conectado tiene sentido dejar tiempo para pulsar el botón
+        cancel_window = HARDWARE_CANCEL_WINDOW_SECONDS if self.arduino else 0
+        self.button_query = None  # Consulta del estado del botón a la espera de respuesta
+        self.operations = OperationManager(OPERATIONS_PER_DEVICE, cancel_window,
+                                           self.on_operation_error, self.on_operations_idle)
 
         self.setup_toolbar()
         self.setup_views()
@@ -33,6 +1323,8 @@ class FileManager(tk.Tk):
         self.refresh()
 
         self.check_cancel_button()  # Inicia la verificación del botón de cancelación
+        self.check_directory_changes()  # Aplica los cambios detectados por el observador
+        self.ui.start()  # Aplica las actualizaciones enviadas por los hilos de trabajo
 
     def setup_toolbar(self):
         self.toolbar = tk.Frame(self, bd=1, relief=tk.RAISED)
@@ -56,9 +1348,23 @@ class FileManager(tk.Tk):
         self.delete_button = ttk.Button(self.toolbar, text='Eliminar', command=self.delete)
         self.delete_button.pack(side=tk.LEFT, padx=2, pady=2)
 
+        self.trash_button = ttk.Button(self.toolbar, text='Papelera', command=self.show_trash_window)
+        self.trash_button.pack(side=tk.LEFT, padx=2, pady=2)
+
         self.path_label = ttk.Label(self.toolbar, text=self.get_relative_path(self.current_path))
         self.path_label.pack(side=tk.LEFT, padx=2, pady=2)
 
+        self.search_button = ttk.Button(self.toolbar, text='Buscar', command=self.search)
+        self.search_button.pack(side=tk.RIGHT, padx=2, pady=2)
+
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.toolbar, textvariable=self.search_var, width=25)
+        self.search_entry.pack(side=tk.RIGHT, padx=2, pady=2)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+
+        self.content_search_button = ttk.Button(self.toolbar, text='Buscar en archivos', command=self.show_content_search_window)
+        self.content_search_button.pack(side=tk.RIGHT, padx=2, pady=2)
+
     def setup_views(self):
         self.container = tk.Frame(self)
         self.container.pack(fill=tk.BOTH, expand=True)
@@ -69,57 +1375,108 @@ class FileManager(tk.Tk):
         self.tree_scroll_y = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL)
         self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.tree = ttk.Treeview(self.tree_frame, columns=('Size', 'Modified'), yscrollcommand=self.tree_scroll_y.set)
+        # Lista virtual: la barra de desplazamiento se controla a mano y solo se insertan las filas visibles
+        self.tree = ttk.Treeview(self.tree_frame, columns=('Size', 'Modified'))
         self.tree.heading('#0', text='Nombre', command=lambda: self.treeview_sort_column('name'))
         self.tree.heading('Size', text='Tamaño', command=lambda: self.treeview_sort_column('size'))
         self.tree.heading('Modified', text='Última modificación', command=lambda: self.treeview_sort_column('modified'))
         self.tree.column('#0', stretch=tk.YES)
         self.tree.column('Size', stretch=tk.YES)
         self.tree.column('Modified', stretch=tk.YES)
+        self.tree.bind("<Button-1>", self.remember_selection_modifiers)
         self.tree.bind("<Button-3>", self.show_context_menu)
         self.tree.bind("<Double-1>", self.on_double_click)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<Configure>", lambda event: self.render_viewport())
+        self.tree.bind("<MouseWheel>", self.on_tree_mousewheel)
+        self.tree.bind("<Button-4>", self.on_tree_mousewheel)
+        self.tree.bind("<Button-5>", self.on_tree_mousewheel)
+        self.tree.bind("<Up>", lambda event: self.move_tree_focus(-1))
+        self.tree.bind("<Down>", lambda event: self.move_tree_focus(1))
         self.tree.pack(fill=tk.BOTH, expand=True)
 
-        self.tree_scroll_y.config(command=self.tree.yview)
+        self.row_height = int(ttk.Style(self).lookup('Treeview', 'rowheight') or 20)
+        self.tree_scroll_y.config(command=self.on_tree_scroll)
 
         self.grid_frame = Frame(self.container)
-        self.grid_labels = []
+
+        self.grid_scroll_y = ttk.Scrollbar(self.grid_frame, orient=tk.VERTICAL)
+        self.grid_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.grid_canvas = tk.Canvas(self.grid_frame, highlightthickness=0, yscrollcommand=self.on_grid_scroll)
+        self.grid_canvas.bind("<Configure>", lambda event: self.display_grid_view())
+        self.grid_canvas.bind("<MouseWheel>", self.on_grid_mousewheel)
+        self.grid_canvas.bind("<Button-4>", self.on_grid_mousewheel)
+        self.grid_canvas.bind("<Button-5>", self.on_grid_mousewheel)
+        self.grid_canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.grid_scroll_y.config(command=self.grid_canvas.yview)
+        self.grid_tiles = []  # (frame, label, id en el canvas); se reutilizan, nunca se destruyen
 
     def toggle_view(self):
         if self.view_mode == 'details':
             self.view_mode = 'grid'
-            self.tree.pack_forget()
-            self.display_grid_view()
+            self.tree_frame.pack_forget()
+            self.grid_frame.pack(fill=tk.BOTH, expand=True)
         else:
             self.view_mode = 'details'
             self.grid_frame.pack_forget()
-            self.tree.pack(fill=tk.BOTH, expand=True)
-        self.refresh()
+            self.tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.display_entries()  # Ambas vistas comparten el mismo listado
 
     def display_grid_view(self):
-        for label in self.grid_labels:
-            label.destroy()
-        self.grid_labels.clear()
-
-        row = 0
-        column = 0
-        for entry in os.scandir(self.current_path):
-            frame = Frame(self.grid_frame, borderwidth=1, relief=tk.RAISED)
-            label = Label(frame, text=entry.name, padx=10, pady=10)
-            label.pack()
-            frame.grid(row=row, column=column, sticky='nsew', padx=5, pady=5)
-            self.grid_labels.append(frame)
-            column += 1
-            if column > 3:
-                column = 0
-                row += 1
-        self.grid_frame.pack(fill=tk.BOTH, expand=True)
+        columns = self.get_grid_column_count()
+        total_rows = -(-len(self.visible_entries) // columns)
+        self.grid_canvas.config(scrollregion=(0, 0, columns * GRID_TILE_WIDTH, total_rows * GRID_TILE_HEIGHT))
+        self.place_grid_tiles()
+
+    def get_grid_column_count(self):
+        return max(1, self.grid_canvas.winfo_width() // GRID_TILE_WIDTH)
+
+    def place_grid_tiles(self):
+        # Solo se colocan los mosaicos de las filas visibles, reutilizando los ya creados
+        columns = self.get_grid_column_count()
+        first_row = max(0, int(self.grid_canvas.canvasy(0)) // GRID_TILE_HEIGHT)
+        visible_rows = self.grid_canvas.winfo_height() // GRID_TILE_HEIGHT + 2
+        first_index = first_row * columns
+        window = self.visible_entries[first_index:first_index + visible_rows * columns]
+        while len(self.grid_tiles) < len(window):
+            self.grid_tiles.append(self.create_grid_tile())
+        for offset, (frame, label, window_id) in enumerate(self.grid_tiles):
+            if offset < len(window):
+                row, column = divmod(first_index + offset, columns)
+                label.config(text=window[offset].name)
+                self.grid_canvas.coords(window_id, column * GRID_TILE_WIDTH, row * GRID_TILE_HEIGHT)
+                self.grid_canvas.itemconfigure(window_id, state='normal')
+            else:
+                self.grid_canvas.itemconfigure(window_id, state='hidden')
+
+    def create_grid_tile(self):
+        frame = Frame(self.grid_canvas, borderwidth=1, relief=tk.RAISED)
+        label = Label(frame, padx=10, pady=10)
+        label.pack(fill=tk.BOTH, expand=True)
+        for widget in (frame, label):
+            widget.bind("<MouseWheel>", self.on_grid_mousewheel)
+            widget.bind("<Button-4>", self.on_grid_mousewheel)
+            widget.bind("<Button-5>", self.on_grid_mousewheel)
+        window_id = self.grid_canvas.create_window(0, 0, window=frame, anchor='nw',
+                                                   width=GRID_TILE_WIDTH - 10, height=GRID_TILE_HEIGHT - 10)
+        return frame, label, window_id
+
+    def on_grid_scroll(self, first, last):
+        self.grid_scroll_y.set(first, last)
+        self.place_grid_tiles()
+
+    def on_grid_mousewheel(self, event):
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.grid_canvas.yview_scroll(direction, 'units')
+        return 'break'
 
     def refresh(self):
-        if self.view_mode == 'details':
-            self.load_directory_contents(self.current_path)
-        elif self.view_mode == 'grid':
-            self.display_grid_view()
+        if self.search_active:
+            self.search()  # Repite la búsqueda para reflejar los cambios
+            return
+        self.load_directory_contents(self.current_path)
         self.update_path_label()
         self.control_led_pin2(False)  # Apaga el LED del pin 2
 
@@ -130,37 +1487,312 @@ class FileManager(tk.Tk):
         return os.path.relpath(path, self.base_path)
 
     def load_directory_contents(self, path):
-        items = []
-        for entry in os.scandir(path):
-            size = '<DIR>' if entry.is_dir() else f'{os.path.getsize(entry.path)} bytes'
-            mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(entry.path)))
-            items.append((entry.name, size, mod_time, entry.path))
-        
-        sorted_items = self.bubble_sort(items, self.sort_column, self.reverse_sort)
-
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for entry in sorted_items:
-            self.tree.insert('', 'end', iid=entry[3], text=entry[0], values=(entry[1], entry[2]))
-
-    def bubble_sort(self, items, column, reverse):
-        n = len(items)
-        for i in range(n):
-            for j in range(0, n-i-1):
-                if column == 'name':
-                    a, b = items[j][0], items[j+1][0]
-                elif column == 'size':
-                    a, b = self.convert_size(items[j][1]), self.convert_size(items[j+1][1])
-                elif column == 'modified':
-                    a, b = items[j][2], items[j+1][2]
-                if (a > b and not reverse) or (a < b and reverse):
-                    items[j], items[j+1] = items[j+1], items[j]
-        return items
+        self.scan_generation += 1  # Cancela cualquier escaneo anterior que siga en curso
+        generation = self.scan_generation
+        self.scanned_entries = []
+        self.scan_in_progress = True
+        if path != self.listed_path:
+            # Directorio nuevo: se vacía la vista y se muestra el listado parcial
+            self.listed_path = path
+            self.watcher.watch(path)
+            self.entries = []
+            self.sort_cache.clear()  # Las ordenaciones anteriores ya no son válidas
+            self.visible_entries = []
+            self.view_offset = 0
+            self.selected_paths.clear()
+            self.dir_sizes.clear()
+            self.dir_sizes_pending.clear()
+            self.size_generation += 1  # Cancela los cálculos de tamaño del directorio anterior
+            self.render_current_view()
+            self.grid_canvas.yview_moveto(0)
+            # Al navegar se acepta un listado en caché si el directorio no cambió
+            self.scan_executor.submit(self.scan_directory, path, generation, True)
+        else:
+            # Al actualizar siempre se vuelve a leer: el mtime del directorio no refleja
+            # los cambios de tamaño de los archivos
+            self.scan_executor.submit(self.scan_directory, path, generation, False)
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
+
+    def scan_directory(self, path, generation, use_cache):
+        batch = []
+        scanned = []  # Listado completo, para el índice persistente
+        last_flush = time.monotonic()
+        try:
+            # El validador se toma antes de leer, así un cambio durante el escaneo invalida el resultado
+            validator = get_directory_validator(path)
+            if use_cache:
+                cached = self.listing_cache.get(path, validator)
+                if cached is None and self.metadata_index is not None:
+                    indexed = self.metadata_index.load(path)
+                    if indexed is not None:
+                        # Se pinta el listado guardado y el escaneo lo revalida siempre: aunque el
+                        # directorio no cambie, los tamaños y fechas de sus archivos pueden haber cambiado
+                        self.ui.post(self.apply_index_snapshot, generation, indexed[1])
+                if cached is not None:
+                    self.scan_queue.put((generation, cached, True, None, validator))
+                    return
+            with os.scandir(path) as it:
+                for entry in it:
+                    if generation != self.scan_generation:
+                        return  # El usuario ya navegó a otro directorio
+                    try:
+                        directory_entry = make_directory_entry(entry)
+                    except OSError:
+                        continue  # La entrada desapareció o es un enlace roto
+                    batch.append(directory_entry)
+                    scanned.append(directory_entry)
+                    # Envía lotes llenos, o lo que haya si el disco es lento
+                    if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_flush > SCAN_FLUSH_SECONDS:
+                        self.scan_queue.put((generation, batch, False, None, None))
+                        batch = []
+                        last_flush = time.monotonic()
+        except OSError as e:
+            self.scan_queue.put((generation, batch, True, e, None))
+            return
+        self.scan_queue.put((generation, batch, True, None, validator))
+        self.filename_index.update(path, [entry.name for entry in scanned])
+        if self.metadata_index is not None:
+            self.metadata_index.save(path, validator, scanned)
+
+    def apply_index_snapshot(self, generation, entries):
+        # Solo si el escaneo sigue en curso; al terminar, apply_scan_result aplica solo las diferencias
+        if generation == self.scan_generation and self.scan_in_progress:
+            self.apply_scan_result(entries)
+
+    def process_scan_queue(self, generation):
+        if generation != self.scan_generation:
+            return  # Hay un escaneo más reciente con su propio sondeo
+        while True:
+            try:
+                batch_generation, batch, finished, error, validator = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch_generation != self.scan_generation:
+                continue
+            self.scanned_entries.extend(batch)
+            if finished:
+                self.scan_in_progress = False
+                if error:
+                    messagebox.showerror("Error", f"Error al leer el directorio: {error}")
+                else:
+                    self.listing_cache.put(self.listed_path, validator, self.scanned_entries)
+                self.apply_scan_result(self.scanned_entries)
+                return
+            if not self.entries:
+                self.visible_entries = self.scanned_entries  # Listado parcial mientras el escaneo continúa
+                self.render_current_view()
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
+
+    def apply_scan_result(self, scanned):
+        # Compara con el listado anterior por ruta y solo aplica lo que cambió
+        previous = {entry.path: entry for entry in self.entries}
+        current = {entry.path: entry for entry in scanned}
+        added = current.keys() - previous.keys()
+        removed = previous.keys() - current.keys()
+        changed = {path for path in current.keys() & previous.keys() if current[path] != previous[path]}
+        if self.entries and not (added or removed or changed):
+            # Nada cambió: la vista, la selección y el desplazamiento se quedan como están,
+            # pero un cambio dentro de una subcarpeta no se ve en su entrada
+            self.revalidate_directory_sizes(current, changed)
+            return
+        self.entries = scanned
+        self.selected_paths -= removed
+        self.sort_cache.clear()
+        self.display_entries()
+        self.revalidate_directory_sizes(current, changed)
+
+    def on_directory_changed(self):
+        # Se llama desde el hilo del observador: solo registra la hora del cambio
+        now = time.monotonic()
+        if self.first_change_time is None:
+            self.first_change_time = now
+        self.last_change_time = now
+
+    def check_directory_changes(self):
+        # Agrupa ráfagas de cambios: actualiza tras un breve silencio o, como mucho, cada pocos segundos
+        first, last = self.first_change_time, self.last_change_time
+        if first is not None and not self.scan_in_progress and not self.search_active:
+            now = time.monotonic()
+            if now - last >= WATCH_DEBOUNCE_SECONDS or now - first >= WATCH_MAX_DELAY_SECONDS:
+                self.first_change_time = None
+                self.load_directory_contents(self.current_path)
+        self.after(WATCH_CHECK_MS, self.check_directory_changes)
+
+    def display_entries(self):
+        self.visible_entries = self.get_sorted_entries()
+        self.entry_index = {entry.path: index for index, entry in enumerate(self.visible_entries)}
+        self.render_current_view()
+
+    def render_current_view(self):
+        if self.view_mode == 'grid':
+            self.display_grid_view()
+        else:
+            self.render_viewport()
+
+    def get_visible_row_count(self):
+        # Descuenta la fila de encabezados
+        return max(1, self.tree.winfo_height() // self.row_height - 1)
+
+    def render_viewport(self):
+        total = len(self.visible_entries)
+        visible_rows = self.get_visible_row_count()
+        self.view_offset = max(0, min(self.view_offset, total - visible_rows))
+        window = self.visible_entries[self.view_offset:self.view_offset + visible_rows + VIRTUAL_OVERSCAN]
+        self.update_tree_rows(window)
+        self.tree.yview_moveto(0)
+        self.tree.selection_set([entry.path for entry in window if entry.path in self.selected_paths])
+        if total:
+            self.tree_scroll_y.set(self.view_offset / total, min(1.0, (self.view_offset + visible_rows) / total))
+        else:
+            self.tree_scroll_y.set(0, 1)
+
+    def on_tree_scroll(self, action, value, unit=None):
+        if action == 'moveto':
+            self.view_offset = int(float(value) * len(self.visible_entries))
+        elif action == 'scroll':
+            step = self.get_visible_row_count() if unit == 'pages' else 1
+            self.view_offset += int(value) * step
+        self.render_viewport()
+
+    def on_tree_mousewheel(self, event):
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.view_offset += direction * WHEEL_SCROLL_ROWS
+        self.render_viewport()
+        return 'break'  # Evita que el Treeview desplace sus propias filas
+
+    def remember_selection_modifiers(self, event):
+        self.extend_selection = bool(event.state & (0x0001 | 0x0004))  # Mayúsculas o Ctrl
+
+    def on_tree_select(self, event):
+        selection = set(self.tree.selection())
+        materialized = set(self.tree.get_children())
+        if selection == self.selected_paths & materialized:
+            return  # La selección que acaba de poner render_viewport
+        if self.extend_selection:
+            # Ctrl o Mayúsculas amplían la selección: se conservan las filas fuera de la vista
+            self.selected_paths = (self.selected_paths - materialized) | selection
+        else:
+            # Un clic normal sustituye toda la selección, también la que no está a la vista
+            self.selected_paths = selection
+
+    def move_tree_focus(self, step):
+        if not self.visible_entries:
+            return 'break'
+        index = self.entry_index.get(self.tree.focus(), self.view_offset - step)
+        index = max(0, min(index + step, len(self.visible_entries) - 1))
+        visible_rows = self.get_visible_row_count()
+        if index < self.view_offset:
+            self.view_offset = index
+        elif index >= self.view_offset + visible_rows:
+            self.view_offset = index - visible_rows + 1
+        path = self.visible_entries[index].path
+        self.selected_paths = {path}
+        self.render_viewport()
+        self.tree.focus(path)
+        return 'break'
+
+    def update_tree_rows(self, window):
+        # Reconcilia las filas materializadas con las deseadas usando la ruta como iid:
+        # solo se borran, insertan, actualizan o mueven las filas que difieren
+        wanted = {entry.path for entry in window}
+        stale = [entry.path for entry in self.rendered_rows if entry.path not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+        rendered = {entry.path: entry for entry in self.rendered_rows if entry.path in wanted}
+        order = [entry.path for entry in self.rendered_rows if entry.path in wanted]
+        for index, entry in enumerate(window):
+            size = self.format_entry_size(entry)
+            mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.mtime))
+            if entry.path not in rendered:
+                self.tree.insert('', index, iid=entry.path, text=entry.name, values=(size, mod_time))
+                order.insert(index, entry.path)
+                continue
+            if rendered[entry.path] != entry:
+                self.tree.item(entry.path, text=entry.name, values=(size, mod_time))
+            if order[index] != entry.path:
+                self.tree.move(entry.path, '', index)
+                order.remove(entry.path)
+                order.insert(index, entry.path)
+        self.rendered_rows = window
 
-    def convert_size(self, size_str):
-        if size_str == '<DIR>':
-            return 0
-        return int(size_str.split()[0])
+    def get_sorted_entries(self):
+        ordered = self.sort_cache.get(self.sort_column)
+        if ordered is None:
+            key = SORT_KEYS[self.sort_column]
+            if self.sort_column == 'size':
+                # Las carpetas ordenan por su tamaño recursivo en cuanto se conoce
+                key = lambda entry: self.dir_sizes.get(entry.path, entry.size)
+            ordered = sorted(self.entries, key=key)
+            self.sort_cache[self.sort_column] = ordered
+        return ordered[::-1] if self.reverse_sort else ordered
+
+    def format_entry_size(self, entry):
+        if not entry.is_dir:
+            return f'{entry.size} bytes'
+        if entry.path in self.dir_sizes:
+            return f'{self.dir_sizes[entry.path]} bytes'
+        return 'Calculando...' if entry.path in self.dir_sizes_pending else '<DIR>'
+
+    def revalidate_directory_sizes(self, current, changed):
+        # Olvida los tamaños de las carpetas que ya no están o cuya entrada cambió y recalcula el resto:
+        # DirectorySizeCache valida cada nivel por su mtime, así solo se releen los directorios cambiados
+        known = self.dir_sizes.keys() | self.dir_sizes_pending
+        if not known:
+            return
+        for path in list(self.dir_sizes):
+            if path not in current or path in changed:
+                del self.dir_sizes[path]
+        self.size_generation += 1  # Los cálculos en curso pueden haber leído el estado anterior
+        self.dir_sizes_pending.clear()
+        self.calculate_directory_sizes([entry.path for entry in self.visible_entries if entry.path in known])
+        if self.sort_column == 'size':
+            self.sort_cache.pop('size', None)  # El orden dependía de los tamaños olvidados
+            self.display_entries()
+
+    def calculate_selected_sizes(self):
+        self.calculate_directory_sizes(self.get_selected_paths())
+
+    def calculate_all_sizes(self):
+        self.calculate_directory_sizes([entry.path for entry in self.get_sorted_entries()])
+
+    def calculate_directory_sizes(self, paths):
+        # En el orden de la vista, así las carpetas visibles se rellenan primero
+        listed_dirs = {entry.path for entry in self.entries if entry.is_dir}
+        dirs = [path for path in paths if path in listed_dirs and path not in self.dir_sizes_pending]
+        if not dirs:
+            return
+        self.dir_sizes_pending.update(dirs)
+        self.show_directory_sizes()
+        Thread(target=self.compute_directory_sizes, args=(dirs, self.size_generation), daemon=True).start()
+
+    def compute_directory_sizes(self, paths, generation):
+        # Las carpetas se calculan una tras otra y cada resultado se muestra en cuanto está listo
+        should_stop = lambda: self.size_generation != generation
+        for path in paths:
+            try:
+                total = compute_directory_size(path, self.size_executor, self.size_cache, should_stop)
+            except OSError:
+                total = None
+            if should_stop():
+                return
+            self.ui.post(self.apply_directory_size, generation, path, total)
+            self.ui.post(self.show_directory_sizes)  # Se agrupa: una sola actualización por ciclo
+
+    def apply_directory_size(self, generation, path, total):
+        if generation != self.size_generation:
+            return
+        self.dir_sizes_pending.discard(path)
+        if total is not None:
+            self.dir_sizes[path] = total
+
+    def show_directory_sizes(self):
+        if self.sort_column == 'size':
+            self.sort_cache.pop('size', None)
+            self.display_entries()
+        # Las filas ya materializadas no cambian de entrada: su celda de tamaño se actualiza aquí
+        for entry in self.rendered_rows:
+            if entry.is_dir:
+                self.tree.set(entry.path, 'Size', self.format_entry_size(entry))
 
     def treeview_sort_column(self, col):
         if self.sort_column == col:
@@ -168,140 +1800,385 @@ class FileManager(tk.Tk):
         else:
             self.sort_column = col
             self.reverse_sort = False
-        self.refresh()
+        self.display_entries()  # Reordena desde la caché sin volver a leer el directorio
 
     def show_context_menu(self, event):
         iid = self.tree.identify_row(event.y)
         menu = Menu(self, tearoff=0)
         if iid:
-            self.tree.selection_set(iid)
+            if iid not in self.tree.selection():
+                # Con clic sobre una fila ya seleccionada se conserva la selección múltiple;
+                # si no, la fila pasa a ser toda la selección, también la que no está a la vista
+                self.selected_paths = {iid}
+                self.tree.selection_set(iid)
             menu.add_command(label="Renombrar", command=self.rename)
             menu.add_command(label="Eliminar", command=self.delete)
+            menu.add_command(label="Eliminar permanentemente", command=self.delete_permanently)
             menu.add_command(label="Copiar", command=self.copy)
             menu.add_command(label="Cortar", command=self.cut)
+            menu.add_command(label="Calcular tamaño", command=self.calculate_selected_sizes)
         else:
-            menu.add_command(label="Pegar", command=self.paste, state=tk.NORMAL if self.clipboard_path else tk.DISABLED)
+            menu.add_command(label="Pegar", command=self.paste, state=tk.NORMAL if self.clipboard_paths else tk.DISABLED)
             menu.add_command(label="Crear Carpeta", command=self.create_folder)  # Añade la opción Crear Carpeta
             menu.add_command(label="Actualizar", command=self.refresh)  # Añade la opción Actualizar
+            menu.add_command(label="Calcular tamaño de las carpetas", command=self.calculate_all_sizes)
+            menu.add_command(label="Buscar en el contenido", command=self.show_content_search_window)
         menu.post(event.x_root, event.y_root)
 
 
     def on_double_click(self, event):
         selection = self.tree.selection()
         if selection:
-            item = selection[0]
-            path = self.tree.item(item, 'text')
-            full_path = os.path.join(self.current_path, path)
+            full_path = selection[0]  # Las filas usan la ruta completa como iid
+            if self.search_active and not os.path.isdir(full_path):
+                full_path = os.path.dirname(full_path)  # Un archivo encontrado abre la carpeta que lo contiene
             if os.path.isdir(full_path):
                 self.history.append(self.current_path)
                 self.current_path = full_path
+                self.leave_search()
                 self.refresh()
 
     def go_back(self):
         if self.history:
             self.current_path = self.history.pop()
+            self.leave_search()
             self.refresh()
 
+    def search(self):
+        query = self.search_var.get().strip()
+        if not query:
+            if self.search_active:
+                self.leave_search()
+                self.refresh()
+            return
+        self.search_active = True
+        self.search_generation += 1
+        self.scan_generation += 1  # Detiene el escaneo del directorio que pudiera estar en curso
+        self.scan_in_progress = False
+        self.listed_path = None  # Al salir de la búsqueda el directorio se vuelve a cargar completo
+        self.entries = []
+        self.sort_cache.clear()
+        self.visible_entries = []
+        self.entry_index = {}
+        self.view_offset = 0
+        self.selected_paths.clear()
+        self.render_current_view()
+        self.path_label.config(text=f"Resultados de «{query}»")
+        Thread(target=self.run_search, args=(query, self.search_generation), daemon=True).start()
+
+    def leave_search(self):
+        self.search_active = False
+        self.search_generation += 1
+        self.search_var.set('')
+
+    def run_search(self, query, generation):
+        # Los resultados se envían por lotes, así los primeros se ven mientras sigue la búsqueda
+        batch = []
+        found = 0
+        for path in self.filename_index.search(query):
+            if generation != self.search_generation:
+                return
+            try:
+                batch.append(make_search_result(path, self.base_path))
+            except OSError:
+                continue  # Ya no existe: el índice se corrige con el próximo escaneo de su carpeta
+            found += 1
+            if found >= SEARCH_MAX_RESULTS:
+                break
+            if len(batch) >= SCAN_BATCH_SIZE:
+                self.ui.post(self.add_search_results, generation, batch)
+                batch = []
+        self.ui.post(self.add_search_results, generation, batch)
+
+    def add_search_results(self, generation, results):
+        if generation != self.search_generation:
+            return
+        self.entries = self.entries + results
+        self.sort_cache.clear()
+        self.display_entries()
+
+    def show_content_search_window(self):
+        if self.content_search_window is not None and self.content_search_window.winfo_exists():
+            self.content_search_window.lift()
+            return
+        self.content_search_window = Toplevel(self)
+        self.content_search_window.title("Buscar en el contenido")
+        self.content_search_window.geometry("800x400")
+        # Cerrar la ventana detiene también la búsqueda que estuviera en curso
+        self.content_search_window.protocol("WM_DELETE_WINDOW", self.close_content_search_window)
+        controls = Frame(self.content_search_window)
+        controls.pack(fill=tk.X, padx=5, pady=5)
+        self.content_pattern_var = tk.StringVar()
+        pattern_entry = ttk.Entry(controls, textvariable=self.content_pattern_var, width=40)
+        pattern_entry.pack(side=tk.LEFT, padx=2)
+        pattern_entry.bind("<Return>", lambda event: self.start_content_search())
+        self.content_regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text='Expresión regular', variable=self.content_regex_var).pack(side=tk.LEFT, padx=2)
+        self.content_ignore_case_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text='Ignorar mayúsculas', variable=self.content_ignore_case_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text='Buscar', command=self.start_content_search).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text='Cancelar', command=self.cancel_content_search).pack(side=tk.LEFT, padx=2)
+        self.content_results = ttk.Treeview(self.content_search_window, columns=('Line', 'Text'))
+        self.content_results.heading('#0', text='Archivo')
+        self.content_results.heading('Line', text='Línea')
+        self.content_results.heading('Text', text='Texto')
+        self.content_results.column('#0', width=250)
+        self.content_results.column('Line', width=60)
+        self.content_results.column('Text', width=450)
+        self.content_results.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.content_results.bind("<Double-1>", self.open_content_result)
+        self.content_status_var = tk.StringVar()
+        ttk.Label(self.content_search_window, textvariable=self.content_status_var).pack(fill=tk.X, padx=5, pady=2)
+        pattern_entry.focus_set()
+
+    def start_content_search(self):
+        pattern = self.content_pattern_var.get()
+        if not pattern:
+            return
+        # MULTILINE: se busca sobre bloques de varias líneas y ^ y $ deben referirse a cada línea
+        flags = re.MULTILINE | (re.IGNORECASE if self.content_ignore_case_var.get() else 0)
+        # Sin distinguir mayúsculas se busca en texto decodificado, más lento pero correcto fuera de ASCII
+        source = pattern if self.content_ignore_case_var.get() else pattern.encode('utf-8')
+        try:
+            regex = re.compile(source if self.content_regex_var.get() else re.escape(source), flags)
+        except re.error as e:
+            messagebox.showerror("Error", f"Expresión regular no válida: {e}", parent=self.content_search_window)
+            return
+        self.cancel_content_search()  # Una búsqueda nueva sustituye a la anterior
+        self.content_search_generation += 1
+        self.content_results.delete(*self.content_results.get_children())
+        # Solo lee: no pasa por la cola de operaciones, así no ocupa un turno del dispositivo
+        # ni retrasa pegados y eliminaciones, ni enciende el LED de actividad
+        operation = Operation(0, f"Buscar «{pattern}» en el contenido", self.delayed_content_search,
+                              (self.current_path, regex, self.content_search_generation), None)
+        operation.state = 'En curso'
+        operation.progress = ContentSearchProgress()
+        self.content_search_operation = operation
+        Thread(target=self.run_content_search, args=(operation,), daemon=True).start()
+        self.update_content_search_status(operation)
+
+    def run_content_search(self, operation):
+        try:
+            operation.function(operation, *operation.args)
+        except Exception as e:
+            self.on_operation_error(operation, e)
+        finally:
+            operation.state = 'Terminada'
+
+    def update_content_search_status(self, operation):
+        if operation is not self.content_search_operation or not self.content_search_window.winfo_exists():
+            return
+        if operation.state == 'En curso':
+            state = 'Cancelando' if operation.is_cancelled() else 'Buscando'
+            self.after(PROGRESS_UPDATE_MS, self.update_content_search_status, operation)
+        else:
+            state = 'Cancelada' if operation.is_cancelled() else 'Terminada'
+        self.content_status_var.set(f"{state}: {operation.progress.describe()}")
+
+    def cancel_content_search(self):
+        if self.content_search_operation is not None:
+            self.content_search_operation.cancel()
+
+    def close_content_search_window(self):
+        self.cancel_content_search()
+        self.content_search_window.destroy()
+
+    def is_content_search_running(self):
+        operation = self.content_search_operation
+        return operation is not None and operation.state == 'En curso' and not operation.is_cancelled()
+
+    def delayed_content_search(self, operation, root, regex, generation):
+        # Se detiene al cancelar o al llegar al límite de resultados
+        should_stop = lambda: operation.is_cancelled() or operation.progress.matches >= GREP_MAX_RESULTS
+        on_matches = lambda path, matches: self.ui.post(self.add_content_matches, generation, root, path, matches)
+        search_file_contents(root, regex, operation.progress, should_stop, on_matches)
+
+    def add_content_matches(self, generation, root, path, matches):
+        if generation != self.content_search_generation or not self.content_search_window.winfo_exists():
+            return
+        name = os.path.relpath(path, root)
+        for line_number, text in matches:
+            self.content_results.insert('', 'end', text=name, values=(line_number, text), tags=(path,))
+
+    def open_content_result(self, event):
+        selection = self.content_results.selection()
+        if selection:
+            path = self.content_results.item(selection[0], 'tags')[0]
+            self.history.append(self.current_path)
+            self.current_path = os.path.dirname(path)  # Abre la carpeta que contiene el archivo
+            self.leave_search()
+            self.refresh()
+
+    def crawl_filenames(self):
+        # Recorre base_path en anchura para el índice de búsqueda. Con índice persistente se carga
+        # primero lo guardado, así se puede buscar enseguida, y solo se vuelven a leer los
+        # directorios cuyo validador cambió.
+        saved = {}
+        if self.metadata_index is not None:
+            try:
+                saved = self.metadata_index.load_tree(self.base_path)
+            except sqlite3.Error:
+                saved = {}
+        for path, (_, listing) in saved.items():
+            self.filename_index.update(path, [name for name, _ in listing])
+        visited = set()  # (dispositivo, inodo): evita ciclos por enlaces simbólicos
+        pending = deque([self.base_path])
+        while pending:
+            path = pending.popleft()
+            try:
+                validator = get_directory_validator(path)
+                if validator[:2] in visited:
+                    continue
+                visited.add(validator[:2])
+                saved_listing = saved.pop(path, None)
+                if saved_listing is not None and saved_listing[0] == validator:
+                    # El índice guarda is_dir siguiendo enlaces simbólicos, como se muestra en el listado;
+                    # el recorrido no los sigue, igual que con entry.is_dir(follow_symlinks=False)
+                    pending.extend(subdir for subdir in (os.path.join(path, name) for name, is_dir in saved_listing[1] if is_dir)
+                                   if not os.path.islink(subdir))
+                    continue
+                entries = []
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            entries.append(make_directory_entry(entry))
+                        except OSError:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+            except OSError:
+                self.filename_index.remove(path)
+                continue
+            self.filename_index.update(path, [entry.name for entry in entries])
+            if self.metadata_index is not None:
+                self.metadata_index.save(path, validator, entries)
+        for path in saved:
+            self.filename_index.remove(path)  # Directorios guardados que ya no existen
+
     def create_folder(self):
         new_folder_name = simpledialog.askstring("Crear Carpeta", "Nombre de la nueva carpeta:")
         if new_folder_name:
-            self.control_led(True)  # Enciende el LED del pin 4
-            self.show_progress_window()
-            Thread(target=self.delayed_create_folder, args=(new_folder_name,)).start()
-
-    def delayed_create_folder(self, new_folder_name):
-        self.operation_in_progress = True
-        time.sleep(2)  # Añadir un retraso de 2 segundos
-        new_folder_path = os.path.join(self.current_path, new_folder_name)
+            # Las rutas se resuelven al encolar, por si el usuario navega antes de que se ejecute
+            self.submit_operation(f"Crear carpeta {new_folder_name}", self.current_path,
+                                  self.delayed_create_folder, os.path.join(self.current_path, new_folder_name))
+
+    def delayed_create_folder(self, operation, new_folder_path):
         try:
-            if not self.cancel_operation:
+            if not operation.is_cancelled():
                 os.makedirs(new_folder_path)
-                self.refresh()
+                self.ui.post(self.refresh)
         except FileExistsError:
-            if not self.cancel_operation:
-                messagebox.showerror("Error", "Una carpeta con ese nombre ya existe.")
-        finally:
-            self.progress_window.destroy()
-            if self.cancel_operation:
-                self.show_cancellation_message()
-            self.control_led(False)  # Apaga el LED del pin 4
-            self.operation_in_progress = False
-            self.cancel_operation = False
+            if not operation.is_cancelled():
+                self.ui.post(messagebox.showerror, "Error", "Una carpeta con ese nombre ya existe.")
 
     def rename(self):
-        item = self.tree.selection()[0]
-        old_name = self.tree.item(item, 'text')
+        old_path = self.tree.selection()[0]  # La ruta completa también vale para los resultados de búsqueda
+        old_name = os.path.basename(old_path)
         new_name = simpledialog.askstring("Renombrar", "Nuevo nombre:", initialvalue=old_name)
         if new_name and new_name != old_name:
-            self.control_led(True)  # Enciende el LED
-            self.show_progress_window()
-            Thread(target=self.delayed_rename, args=(old_name, new_name)).start()
+            parent = os.path.dirname(old_path)
+            self.submit_operation(f"Renombrar {old_name} a {new_name}", parent, self.delayed_rename,
+                                  old_path, os.path.join(parent, new_name))
 
-    def delayed_rename(self, old_name, new_name):
-        self.operation_in_progress = True
-        time.sleep(2)  # Añadir un retraso de 2 segundos
+    def delayed_rename(self, operation, old_path, new_path):
         try:
-            if not self.cancel_operation:
-                os.rename(os.path.join(self.current_path, old_name), os.path.join(self.current_path, new_name))
-                self.refresh()
+            if not operation.is_cancelled():
+                os.rename(old_path, new_path)
+                self.ui.post(self.refresh)
         except Exception as e:
-            if not self.cancel_operation:
-                messagebox.showerror("Error", f"Error al renombrar: {e}")
-        finally:
-            self.progress_window.destroy()
-            if self.cancel_operation:
-                self.show_cancellation_message()
-            self.control_led(False)  # Apaga el LED
-            self.operation_in_progress = False
-            self.cancel_operation = False
+            if not operation.is_cancelled():
+                self.ui.post(messagebox.showerror, "Error", f"Error al renombrar: {e}")
 
     def delete(self):
-        item = self.tree.selection()[0]
-        name = self.tree.item(item, 'text')
-        response = messagebox.askyesno("Eliminar", "¿Estás seguro de querer eliminar esto?")
+        # Mover a la papelera es un renombrado: se hace aquí mismo, sin pasar por la cola de operaciones
+        paths = self.get_selected_paths()
+        if not paths:
+            return
+        if len(paths) == 1:
+            question = "¿Mover esto a la papelera?"
+        else:
+            question = f"¿Mover estos {len(paths)} elementos a la papelera?"
+        if not messagebox.askyesno("Eliminar", question):
+            return
+        failures = []
+        unavailable = []  # Sin papelera posible: otro sistema de archivos montado o raíz sin permiso de escritura
+        for path in paths:
+            try:
+                self.trash.move_to_trash(path)
+            except OSError as e:
+                (unavailable if e.errno in TRASH_UNAVAILABLE_ERRORS else failures).append((path, e))
+        self.refresh()
+        if failures:
+            self.show_failures("mover a la papelera", failures, len(paths))
+        if unavailable:
+            question = (f"No se pueden mover {len(unavailable)} elementos a la papelera ({unavailable[0][1].strerror}).\n"
+                        "¿Eliminarlos permanentemente?")
+            if messagebox.askyesno("Eliminar", question):
+                self.submit_delete([path for path, _ in unavailable])
+
+    def delete_permanently(self):
+        paths = self.get_selected_paths()
+        if not paths:
+            return
+        if len(paths) == 1:
+            question = "¿Estás seguro de querer eliminar esto?"
+        else:
+            question = f"¿Estás seguro de querer eliminar estos {len(paths)} elementos?"
+        response = messagebox.askyesno("Eliminar", question)
         if response:
-            self.control_led(True)  # Enciende el LED
-            self.show_progress_window()
-            Thread(target=self.delayed_delete, args=(name,)).start()
+            self.submit_delete(paths)
 
-    def delayed_delete(self, name):
-        self.operation_in_progress = True
-        time.sleep(2)  # Añadir un retraso de 2 segundos
-        try:
-            if not self.cancel_operation:
-                path = os.path.join(self.current_path, name)
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
+    def submit_delete(self, paths):
+        if len(paths) == 1:
+            description = f"Eliminar {os.path.basename(paths[0])}"
+        else:
+            description = f"Eliminar {len(paths)} elementos"
+        self.submit_operation(description, self.current_path, self.delayed_delete, paths)
+
+    def delayed_delete(self, operation, paths):
+        # Cada elemento se elimina por separado: un fallo no detiene al resto y se informa al final
+        operation.progress = DeleteProgress()
+        failures = []
+        for path in paths:
+            if operation.is_cancelled():
+                break
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    remove_tree(path, operation.progress, operation.is_cancelled)
                 else:
                     os.remove(path)
-                self.refresh()
-        except Exception as e:
-            if not self.cancel_operation:
-                messagebox.showerror("Error", f"Error al eliminar: {e}")
-        finally:
-            self.progress_window.destroy()
-            if self.cancel_operation:
-                self.show_cancellation_message()
-            self.control_led(False)  # Apaga el LED
-            self.operation_in_progress = False
-            self.cancel_operation = False
+                    operation.progress.add(1)
+            except DeleteCancelled:
+                break
+            except Exception as e:
+                failures.append((path, e))
+        self.ui.post(self.refresh)
+        if failures and not operation.is_cancelled():
+            self.ui.post(self.show_failures, "eliminar", failures, len(paths))
+
+    def get_selected_paths(self):
+        # En el orden de la vista; incluye las filas seleccionadas que no están materializadas
+        return [entry.path for entry in self.visible_entries if entry.path in self.selected_paths]
 
     def copy(self):
-        item = self.tree.selection()[0]
-        self.clipboard_path = os.path.join(self.current_path, self.tree.item(item, 'text'))
+        self.clipboard_paths = self.get_selected_paths()
         self.clipboard_action = 'copy'
 
     def cut(self):
-        item = self.tree.selection()[0]
-        self.clipboard_path = os.path.join(self.current_path, self.tree.item(item, 'text'))
+        self.clipboard_paths = self.get_selected_paths()
         self.clipboard_action = 'cut'
 
     def paste(self):
-        if not self.clipboard_path:
+        if not self.clipboard_paths:
             return
-        self.control_led(True)  # Enciende el LED
-        self.show_progress_window()
-        Thread(target=self.delayed_paste).start()
+        action = "Copiar" if self.clipboard_action == 'copy' else "Mover"
+        if len(self.clipboard_paths) == 1:
+            description = f"{action} {os.path.basename(self.clipboard_paths[0])}"
+        else:
+            description = f"{action} {len(self.clipboard_paths)} elementos"
+        # El portapapeles y el destino se leen ahora: una operación encolada no debe ver cambios posteriores
+        self.submit_operation(description, self.current_path, self.delayed_paste,
+                              list(self.clipboard_paths), self.clipboard_action, self.current_path)
 
     def get_new_folder_name(self, dest_path):
         base, ext = os.path.splitext(dest_path)
@@ -312,44 +2189,187 @@ class FileManager(tk.Tk):
             new_dest = f"{base} ({i}){ext}"
         return new_dest
 
-    def delayed_paste(self):
-        self.operation_in_progress = True
-        time.sleep(2)  # Añadir un retraso de 2 segundos
-        src_path = self.clipboard_path
-        dest_path = os.path.join(self.current_path, os.path.basename(src_path))
-        try:
-            if not self.cancel_operation:
-                if self.clipboard_action == 'copy':
-                    if os.path.isdir(src_path):
+    def delayed_paste(self, operation, src_paths, clipboard_action, dest_dir):
+        # Cada elemento se procesa por separado: un fallo no detiene al resto y se informa al final
+        moved, pending, failures = [], src_paths, []
+        if clipboard_action == 'cut':
+            try:
+                moved, pending, failures = rename_into(src_paths, dest_dir)
+            except OSError as e:
+                pending, failures = [], [(src_path, e) for src_path in src_paths]
+        # Lo que se copia, o se mueve a otro dispositivo, pasa por el motor de copia por bloques
+        jobs = []
+        for src_path in pending:
+            dest_path = os.path.join(dest_dir, os.path.basename(src_path))
+            try:
+                if clipboard_action == 'copy':
+                    if os.path.isdir(src_path) or (os.path.exists(dest_path) and os.path.samefile(src_path, dest_path)):
                         dest_path = self.get_new_folder_name(dest_path) if os.path.exists(dest_path) else dest_path
-                        shutil.copytree(src_path, dest_path)
+                elif os.path.lexists(dest_path):
+                    raise FileExistsError(errno.EEXIST, "Ya existe en el destino", dest_path)
+                jobs.append((src_path, dest_path, plan_copy(src_path, dest_path)))
+            except OSError as e:
+                failures.append((src_path, e))
+        operation.progress = CopyProgress(sum(plan.total_bytes for _, _, plan in jobs))
+        for src_path, dest_path, plan in jobs:
+            if operation.is_cancelled():
+                break
+            try:
+                self.copy_file_or_tree(operation, plan, dest_path)
+            except CopyCancelled:
+                break
+            except Exception as e:
+                failures.append((src_path, e))
+                continue
+            if clipboard_action == 'cut':
+                # El origen solo se borra cuando la copia terminó completa
+                try:
+                    if plan.dirs:
+                        shutil.rmtree(src_path)
                     else:
-                        shutil.copy2(src_path, dest_path)
-                elif self.clipboard_action == 'cut':
-                    shutil.move(src_path, dest_path)
-                    self.clipboard_path = None
-                    self.clipboard_action = None
-                self.refresh()
-        except Exception as e:
-            if not self.cancel_operation:
-                messagebox.showerror("Error", f"Error al pegar el archivo o carpeta: {e}")
-        finally:
-            self.progress_window.destroy()
-            if self.cancel_operation:
-                self.show_cancellation_message()
+                        os.remove(src_path)
+                    moved.append(src_path)
+                except OSError as e:
+                    failures.append((src_path, e))
+        if moved:
+            self.ui.post(self.forget_clipboard_paths, moved)
+        self.ui.post(self.refresh)
+        if failures and not operation.is_cancelled():
+            self.ui.post(self.show_failures, "copiar" if clipboard_action == 'copy' else "mover", failures, len(src_paths))
+
+    def forget_clipboard_paths(self, paths):
+        # Los elementos ya movidos desaparecen del portapapeles
+        paths = set(paths)
+        self.clipboard_paths = [path for path in self.clipboard_paths if path not in paths]
+        if not self.clipboard_paths:
+            self.clipboard_action = None
+
+    def show_trash_window(self):
+        if self.trash_window is not None and self.trash_window.winfo_exists():
+            self.trash_window.lift()
+            self.update_trash_window()
+            return
+        self.trash_window = Toplevel(self)
+        self.trash_window.title("Papelera")
+        self.trash_window.geometry("600x300")
+        self.trash_tree = ttk.Treeview(self.trash_window, columns=('Deleted',))
+        self.trash_tree.heading('#0', text='Ubicación original')
+        self.trash_tree.heading('Deleted', text='Eliminado')
+        self.trash_tree.column('#0', width=420)
+        self.trash_tree.column('Deleted', width=140)
+        self.trash_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        buttons = Frame(self.trash_window)
+        buttons.pack(pady=5)
+        ttk.Button(buttons, text='Restaurar', command=self.restore_from_trash).pack(side=tk.LEFT, padx=2)
+        ttk.Button(buttons, text='Vaciar papelera', command=self.empty_trash).pack(side=tk.LEFT, padx=2)
+        self.update_trash_window()
+
+    def update_trash_window(self):
+        self.trash_items = {item.item_id: item for item in self.trash.list_items()}
+        self.trash_tree.delete(*self.trash_tree.get_children())
+        for item in self.trash_items.values():
+            deleted = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item.deleted_time))
+            self.trash_tree.insert('', 'end', iid=item.item_id, text=item.original_path, values=(deleted,))
+
+    def restore_from_trash(self):
+        selection = self.trash_tree.selection()
+        failures = []
+        for item_id in selection:
+            item = self.trash_items[item_id]
+            try:
+                self.trash.restore(item)
+            except OSError as e:
+                failures.append((item.original_path, e))
+        self.update_trash_window()
+        self.refresh()
+        if failures:
+            self.show_failures("restaurar", failures, len(selection))
+
+    def empty_trash(self):
+        if messagebox.askyesno("Vaciar papelera", "¿Eliminar definitivamente todo el contenido de la papelera?", parent=self.trash_window):
+            self.trash.empty()  # El borrado real lo hace el hilo de purga en segundo plano
+            self.trash_window.destroy()
+
+    def show_failures(self, verb, failures, total):
+        lines = [f"{os.path.basename(path)}: {error}" for path, error in failures[:FAILURE_REPORT_MAX_ITEMS]]
+        if len(failures) > FAILURE_REPORT_MAX_ITEMS:
+            lines.append(f"... y {len(failures) - FAILURE_REPORT_MAX_ITEMS} más")
+        messagebox.showerror("Error", f"No se pudieron {verb} {len(failures)} de {total} elementos:\n\n" + "\n".join(lines))
+
+    def submit_operation(self, description, target_dir, function, *args):
+        try:
+            device = os.stat(target_dir).st_dev  # El límite de concurrencia se aplica por dispositivo
+        except OSError:
+            device = None
+        self.control_led(True)  # Enciende el LED mientras haya operaciones
+        operation = self.operations.submit(description, function, args, device)
+        self.show_operations_window()
+        return operation
+
+    def on_operation_error(self, operation, error):
+        # Un error inesperado no debe detener al resto de operaciones
+        self.ui.post(messagebox.showerror, "Error", f"Error en la operación «{operation.description}»: {error}")
+
+    def on_operations_idle(self):
+        self.ui.post(self.switch_off_idle_led)
+
+    def switch_off_idle_led(self):
+        # Puede haberse encolado otra operación entre el aviso y su aplicación
+        if not self.operations.snapshot():
             self.control_led(False)  # Apaga el LED
-            self.operation_in_progress = False
-            self.cancel_operation = False
-
-    def show_progress_window(self):
-        self.progress_window = Toplevel(self)
-        self.progress_window.title("Procesando")
-        self.progress_window.geometry("300x100")
-        Label(self.progress_window, text="Por favor espera...").pack(pady=20)
-        self.progress_bar = ttk.Progressbar(self.progress_window, mode='indeterminate')
-        self.progress_bar.pack(expand=True, fill=tk.BOTH, padx=20, pady=10)
-        self.progress_bar.start()
-        self.control_led(True)  # Asegura que el LED del pin 4 esté encendido
+            if not self.is_content_search_running():
+                self.button_query = None  # La respuesta pendiente era de una operación ya terminada
+
+    def copy_file_or_tree(self, operation, plan, dest_path):
+        workers = self.copy_workers or default_copy_workers(os.path.dirname(dest_path))
+        try:
+            run_copy_plan(plan, operation.progress, operation.is_cancelled, workers)
+        except BaseException:
+            if plan.dirs:
+                shutil.rmtree(dest_path, ignore_errors=True)  # Elimina la copia parcial de la carpeta
+            raise
+
+    def show_operations_window(self):
+        if self.operations_window is not None and self.operations_window.winfo_exists():
+            return
+        self.operations_window = Toplevel(self)
+        self.operations_window.title("Operaciones")
+        self.operations_window.geometry("600x220")
+        self.operations_tree = ttk.Treeview(self.operations_window, columns=('State', 'Progress'))
+        self.operations_tree.heading('#0', text='Operación')
+        self.operations_tree.heading('State', text='Estado')
+        self.operations_tree.heading('Progress', text='Progreso')
+        self.operations_tree.column('#0', width=260)
+        self.operations_tree.column('State', width=90)
+        self.operations_tree.column('Progress', width=220)
+        self.operations_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ttk.Button(self.operations_window, text='Cancelar', command=self.cancel_selected_operations).pack(pady=5)
+        self.update_operations_window()
+
+    def update_operations_window(self):
+        if not self.operations_window.winfo_exists():
+            return
+        operations = self.operations.snapshot()
+        if not operations:
+            self.operations_window.destroy()  # Todas las operaciones terminaron
+            return
+        current = {str(operation.operation_id) for operation in operations}
+        stale = [iid for iid in self.operations_tree.get_children() if iid not in current]
+        if stale:
+            self.operations_tree.delete(*stale)
+        for operation in operations:
+            progress = operation.progress.describe() if operation.progress is not None else ''
+            state = 'Cancelando' if operation.is_cancelled() else operation.state
+            iid = str(operation.operation_id)
+            if self.operations_tree.exists(iid):
+                self.operations_tree.item(iid, values=(state, progress))
+            else:
+                self.operations_tree.insert('', 'end', iid=iid, text=operation.description, values=(state, progress))
+        self.after(PROGRESS_UPDATE_MS, self.update_operations_window)
+
+    def cancel_selected_operations(self):
+        for iid in self.operations_tree.selection():
+            self.operations.cancel(int(iid))
 
     def show_cancellation_message(self):
         cancellation_message = Toplevel(self)
@@ -364,26 +2384,41 @@ class FileManager(tk.Tk):
         window.destroy()
 
     def control_led(self, state):
+        if self.arduino is None:
+            return
         if state:
-            self.arduino.write(b'H')  # Enciende el LED
+            self.arduino.request('H')  # Enciende el LED
         else:
-            self.arduino.write(b'L')  # Apaga el LED
+            self.arduino.request('L')  # Apaga el LED
 
     def control_led_pin2(self, state):
+        if self.arduino is None:
+            return
         if state:
-            self.arduino.write(b'P')  # Comando personalizado para encender el LED del pin 2
+            self.arduino.request('P')  # Comando personalizado para encender el LED del pin 2
         else:
-            self.arduino.write(b'Q')  # Comando personalizado para apagar el LED del pin 2
+            self.arduino.request('Q')  # Comando personalizado para apagar el LED del pin 2
 
     def check_cancel_button(self):
-        if self.operation_in_progress:
-            self.arduino.write(b'C')  # Enviar solicitud de estado del botón
-            if self.arduino.in_waiting > 0:
-                response = self.arduino.read().decode()
-                if response == '1':  # Suponiendo que '1' indica que el botón ha sido presionado
-                    self.cancel_operation = True
+        # El botón también detiene la búsqueda en el contenido, que no pasa por la cola de operaciones
+        if self.arduino is not None and (self.operations.is_busy() or self.is_content_search_running()):
+            if self.button_query is None:
+                self.button_query = self.arduino.request('C')  # Enviar solicitud de estado del botón
+            elif self.button_query.done():
+                # La respuesta se recoge en una comprobación posterior, sin bloquear la interfaz
+                query, self.button_query = self.button_query, None
+                if query.exception() is None and query.result() == '1':  # '1' indica que el botón ha sido presionado
+                    # El botón cancela todas las operaciones en curso; el mensaje se muestra una sola vez
+                    if self.is_content_search_running():
+                        self.cancel_content_search()
+                    if self.operations.cancel_running():
+                        self.show_cancellation_message()
                     self.control_led_pin2(True)  # Enciende el LED del pin 2 si el botón es presionado
                     self.control_led(False)  # Apaga el LED del pin 4 si el botón es presionado
+        else:
+            # Sin nada que cancelar se descarta la consulta en vuelo: un '1' que llegue ahora
+            # cancelaría la siguiente operación en cuanto empezara
+            self.button_query = None
         self.after(100, self.check_cancel_button)
 
 if __name__ == '__main__':
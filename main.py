@@ -1,8 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog, Menu, Frame, Label
 import os
+import stat
 import time
 import shutil
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+SCAN_WORKERS = 4  # Hilos para leer directorios sin bloquear la interfaz
+SCAN_BATCH_SIZE = 500  # Entradas que se envían a la interfaz en cada lote
+SCAN_FLUSH_SECONDS = 0.1  # Tiempo máximo que un lote incompleto espera antes de enviarse
+SCAN_POLL_MS = 30  # Intervalo con el que la interfaz recoge los lotes
 
 class FileManager(tk.Tk):
     def __init__(self):
@@ -16,6 +24,9 @@ class FileManager(tk.Tk):
         self.sort_column = "name"
         self.reverse_sort = False
         self.view_mode = 'details'  # 'details' or 'grid'
+        self.scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        self.scan_queue = queue.Queue()
+        self.scan_generation = 0  # Cambia en cada escaneo; los escaneos antiguos se descartan
 
         self.setup_toolbar()
         self.setup_views()
@@ -99,12 +110,54 @@ class FileManager(tk.Tk):
             self.display_grid_view()
 
     def load_directory_contents(self, path):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for entry in os.scandir(path):
-            size = '<DIR>' if entry.is_dir() else f'{os.path.getsize(entry.path)} bytes'
-            mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(entry.path)))
-            self.tree.insert('', 'end', iid=entry.path, text=entry.name, values=(size, mod_time))
+        self.scan_generation += 1  # Cancela cualquier escaneo anterior que siga en curso
+        generation = self.scan_generation
+        self.tree.delete(*self.tree.get_children())
+        self.scan_executor.submit(self.scan_directory, path, generation)
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
+
+    def scan_directory(self, path, generation):
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if generation != self.scan_generation:
+                        return  # El usuario ya navegó a otro directorio
+                    try:
+                        st = entry.stat()  # Una sola llamada en lugar de getsize + getmtime
+                        size = '<DIR>' if stat.S_ISDIR(st.st_mode) else f'{st.st_size} bytes'
+                        mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st.st_mtime))
+                    except OSError:
+                        continue  # La entrada desapareció o es un enlace roto
+                    batch.append((entry.name, size, mod_time, entry.path))
+                    # Envía lotes llenos, o lo que haya si el disco es lento
+                    if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_flush > SCAN_FLUSH_SECONDS:
+                        self.scan_queue.put((generation, batch, False, None))
+                        batch = []
+                        last_flush = time.monotonic()
+        except OSError as e:
+            self.scan_queue.put((generation, batch, True, e))
+            return
+        self.scan_queue.put((generation, batch, True, None))
+
+    def process_scan_queue(self, generation):
+        if generation != self.scan_generation:
+            return  # Hay un escaneo más reciente con su propio sondeo
+        while True:
+            try:
+                batch_generation, batch, finished, error = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch_generation != self.scan_generation:
+                continue
+            for entry in batch:  # Listado parcial mientras el escaneo continúa
+                self.tree.insert('', 'end', iid=entry[3], text=entry[0], values=(entry[1], entry[2]))
+            if finished:
+                if error:
+                    messagebox.showerror("Error", f"Error al leer el directorio: {error}")
+                return
+        self.after(SCAN_POLL_MS, self.process_scan_queue, generation)
 
     def show_context_menu(self, event):
         iid = self.tree.identify_row(event.y)
@@ -1,19 +1,503 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, Menu, Frame, Label
 import os
+import struct
+import binascii
+import queue
 import serial
 import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Thread, Lock, Event
+
+RESPONSE_END = 'END'  # Línea con la que el firmware cierra cada respuesta
+RESPONSE_TIMEOUT_SECONDS = 2.0  # Espera máxima a que empiece una respuesta
+RESPONSE_IDLE_SECONDS = 0.2  # Firmware sin marca de fin: la respuesta termina tras este silencio
+SERIAL_READ_TIMEOUT_SECONDS = 0.05  # Cada cuánto revisa el hilo lector las peticiones caducadas
+SERIAL_MAX_REQUEST_ID = 9999  # Los ids de petición vuelven a empezar tras este valor
+LIST_PAGE_SIZE = 32  # Entradas por página de listado: algo más de lo que cabe en una pantalla
+LIST_PREFETCH_FRACTION = 0.8  # Se pide la página siguiente al pasar de esta fracción del desplazamiento
+REMOTE_CACHE_MAX_DIRECTORIES = 64  # Listados remotos guardados en el host
+REMOTE_CACHE_TRUST_SECONDS = 10.0  # Tras validar un listado, se usa sin preguntar al Arduino durante este tiempo
+
+class SerialCommandError(Exception):
+    pass
+
+# Protocolo binario de listados, versión BINARY_PROTOCOL_VERSION. Cada trama es:
+#   FRAME_SYNC, versión, tipo, secuencia (u8), longitud de la carga (u16 LE), carga, CRC-16/CCITT (u16 LE)
+# El CRC cubre de la versión al final de la carga. Tipos: FRAME_ENTRIES lleva registros
+# [flags (bit 0: carpeta), longitud del nombre (varint), nombre UTF-8, tamaño (varint), mtime epoch (varint)],
+# FRAME_END el número total de registros (varint) y FRAME_ERROR un mensaje UTF-8.
+# El host confirma cada trama con FRAME_ACK o pide que se repita con FRAME_NAK.
+BINARY_PROTOCOL_VERSION = 1
+FRAME_SYNC = 0x7E
+FRAME_ENTRIES = 1
+FRAME_END = 2
+FRAME_ERROR = 3
+FRAME_ACK = b'\x06'
+FRAME_NAK = b'\x15'
+FRAME_HEADER = struct.Struct('<BBBBH')
+FRAME_CRC = struct.Struct('<H')
+FRAME_MAX_PAYLOAD = 240  # Lo que el firmware puede montar en RAM de una vez
+FRAME_MAX_RETRIES = 3  # Tramas dañadas seguidas antes de abandonar el listado
+FRAME_TIMEOUT_SECONDS = 2.0  # Espera máxima a que llegue una trama completa
+FLAG_DIRECTORY = 0x01
+
+class FrameError(Exception):
+    pass
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise FrameError("Varint incompleto")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def encode_entry(is_dir, name, size, mtime):
+    name_bytes = name.encode('utf-8')
+    return (bytes([FLAG_DIRECTORY if is_dir else 0]) + encode_varint(len(name_bytes)) + name_bytes
+            + encode_varint(size) + encode_varint(mtime))
+
+def decode_entries(payload):
+    # Devuelve [(es_carpeta, nombre, tamaño, mtime)]
+    entries = []
+    pos = 0
+    while pos < len(payload):
+        flags = payload[pos]
+        name_length, pos = decode_varint(payload, pos + 1)
+        name = payload[pos:pos + name_length].decode('utf-8', 'replace')
+        pos += name_length
+        size, pos = decode_varint(payload, pos)
+        mtime, pos = decode_varint(payload, pos)
+        entries.append((bool(flags & FLAG_DIRECTORY), name, size, mtime))
+    return entries
+
+def encode_frame(frame_type, seq, payload):
+    body = FRAME_HEADER.pack(FRAME_SYNC, BINARY_PROTOCOL_VERSION, frame_type, seq & 0xFF, len(payload))[1:] + payload
+    return bytes([FRAME_SYNC]) + body + FRAME_CRC.pack(binascii.crc_hqx(body, 0xFFFF))
+
+def encode_listing_frames(entries):
+    # Lo que envía el firmware para un listado: registros agrupados sin partir ninguno entre tramas
+    frames = []
+    payload = b''
+    for entry in entries:
+        record = encode_entry(*entry)
+        if payload and len(payload) + len(record) > FRAME_MAX_PAYLOAD:
+            frames.append(encode_frame(FRAME_ENTRIES, len(frames), payload))
+            payload = b''
+        payload += record
+    if payload:
+        frames.append(encode_frame(FRAME_ENTRIES, len(frames), payload))
+    frames.append(encode_frame(FRAME_END, len(frames), encode_varint(len(entries))))
+    return frames
+
+def read_exact(port, count, deadline):
+    data = b''
+    while len(data) < count:
+        if time.monotonic() >= deadline:
+            raise FrameError("Tiempo de espera agotado")
+        data += port.read(count - len(data))
+    return data
+
+def read_frame(port, deadline):
+    # Devuelve (tipo, secuencia, carga) de una trama cuyo FRAME_SYNC ya ha leído el hilo lector
+    header = read_exact(port, FRAME_HEADER.size - 1, deadline)
+    _, version, frame_type, seq, length = FRAME_HEADER.unpack(bytes([FRAME_SYNC]) + header)
+    if version != BINARY_PROTOCOL_VERSION or length > FRAME_MAX_PAYLOAD:
+        raise FrameError("Cabecera de trama no válida")
+    payload = read_exact(port, length, deadline)
+    crc, = FRAME_CRC.unpack(read_exact(port, FRAME_CRC.size, deadline))
+    if binascii.crc_hqx(header + payload, 0xFFFF) != crc:
+        raise FrameError("CRC incorrecto")
+    return frame_type, seq, payload
+
+def parse_text_entry(line):
+    # Formato de texto 'tipo,nombre,tamaño,fecha': el nombre puede contener comas
+    entry_type, _, rest = line.partition(',')
+    fields = rest.rsplit(',', 2)
+    if len(fields) != 3:
+        return None
+    name, size, modified = fields
+    return entry_type, name, size, modified
+
+class PendingRequest:
+    def __init__(self):
+        self.future = Future()
+        self.lines = []
+        self.last_data = time.monotonic()  # Los plazos cuentan desde el último dato recibido
+
+class SerialClient:
+    # Único dueño del puerto serie. Un hilo lector reparte lo que llega entre las peticiones
+    # pendientes y completa su Future, así varias pueden estar en curso a la vez desde cualquier hilo.
+    # Con firmware que acepta ids ('<id> <comando>'), cada línea de respuesta viene precedida del id
+    # de su petición; sin ids, el firmware responde en orden y cada línea es de la petición más antigua.
+    # Las tramas del protocolo binario van a una cola propia mientras hay un listado binario en curso.
+    def __init__(self, port):
+        self.port = port
+        self.port.timeout = SERIAL_READ_TIMEOUT_SECONDS
+        self.lock = Lock()  # Protege la tabla de pendientes y hace atómica cada escritura
+        self.pending = OrderedDict()  # id -> PendingRequest, en orden de envío
+        self.next_id = 1
+        self.tagged = False  # El firmware repite el id de la petición en cada línea
+        self.framed = False  # Ya llegó alguna marca RESPONSE_END: el firmware cierra sus respuestas
+        self.legacy = False  # Firmware sin marca de fin: una orden sin respuesta termina tras el silencio corto
+        self.frames = queue.Queue()  # (tipo, secuencia, carga) o la excepción del lector
+        self.binary_active = Event()
+        Thread(target=self.read_responses, daemon=True).start()
+
+    def submit(self, command):
+        pending = PendingRequest()
+        with self.lock:
+            request_id = self.next_id
+            self.next_id = self.next_id % SERIAL_MAX_REQUEST_ID + 1
+            # Se registra antes de escribir: la respuesta no puede llegar antes que su entrada
+            self.pending[request_id] = pending
+            line = f"{request_id} {command}\n" if self.tagged else f"{command}\n"
+            try:
+                self.port.write(line.encode())
+            except serial.SerialException as e:
+                del self.pending[request_id]
+                pending.future.set_exception(e)
+        return pending.future
+
+    def write(self, data):
+        with self.lock:
+            self.port.write(data)
+
+    def read_responses(self):
+        buffer = b''
+        while True:
+            try:
+                # El primer byte de cada línea se lee aparte: si abre una trama, el resto no es texto.
+                # Se comprueba después de leerlo para no perder tramas si el listado empieza entre medias.
+                # Durante un listado binario se lee byte a byte hasta FRAME_SYNC: readline se tragaría
+                # una trama precedida de basura en la misma línea
+                binary = self.binary_active.is_set()
+                bytewise = binary or not buffer
+                data = self.port.read(1) if bytewise else self.port.readline()
+                if bytewise and data and data[0] == FRAME_SYNC and self.binary_active.is_set():
+                    buffer = b''  # Basura ante la trama, o una línea cortada que ya no terminará
+                    self.read_binary_frame()
+                    continue
+                if data and not buffer and not binary:
+                    data += self.port.readline()
+            except serial.SerialException as e:
+                self.fail_pending(e)
+                self.frames.put(e)
+                return
+            buffer += data
+            if buffer.endswith(b'\n'):
+                self.dispatch(buffer.decode(errors='replace').strip())
+                buffer = b''
+            elif not data and self.binary_active.is_set():
+                buffer = b''  # Restos de una trama dañada
+            self.expire_pending()
+
+    def read_binary_frame(self):
+        try:
+            self.frames.put(read_frame(self.port, time.monotonic() + FRAME_TIMEOUT_SECONDS))
+        except FrameError as e:
+            # Se descarta el resto de la trama dañada antes de pedir que se repita; una respuesta
+            # de texto que llegue mientras tanto se pierde y su petición falla por tiempo
+            while self.port.read(FRAME_MAX_PAYLOAD):
+                pass
+            self.frames.put(e)
+
+    def dispatch(self, line):
+        with self.lock:
+            if self.tagged:
+                request_id, _, line = line.partition(' ')
+                try:
+                    request_id = int(request_id)
+                except ValueError:
+                    return  # Ruido en la línea o una respuesta sin id
+            else:
+                request_id = next(iter(self.pending), None)
+            pending = self.pending.get(request_id)
+            if pending is None:
+                return
+            pending.last_data = time.monotonic()
+            if line != RESPONSE_END:
+                pending.lines.append(line)
+                return
+            self.framed = True
+            del self.pending[request_id]
+        self.complete(pending, self.parse_framed_response)
+
+    def expire_pending(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for request_id, pending in list(self.pending.items()):
+                idle = now - pending.last_data
+                short_idle = not self.tagged and (pending.lines or self.legacy)
+                if (short_idle and idle >= RESPONSE_IDLE_SECONDS) or idle >= RESPONSE_TIMEOUT_SECONDS:
+                    expired.append(self.pending.pop(request_id))
+        for pending in expired:
+            if pending.lines or not (self.tagged or self.framed):
+                # Sin marca de fin, el silencio es la respuesta: muchas órdenes del firmware antiguo no responden nada
+                self.complete(pending, self.parse_legacy_response)
+            else:
+                pending.future.set_exception(SerialCommandError("Sin respuesta del Arduino"))
+
+    def fail_pending(self, error):
+        with self.lock:
+            pending_requests = list(self.pending.values())
+            self.pending.clear()
+        for pending in pending_requests:
+            pending.future.set_exception(error)
+
+    def complete(self, pending, parse):
+        try:
+            pending.future.set_result(parse(pending.lines))
+        except SerialCommandError as e:
+            pending.future.set_exception(e)
+
+    def parse_framed_response(self, lines):
+        status = lines.pop() if lines else ''
+        if status != 'OK':
+            raise SerialCommandError(status[len('ERROR'):].strip() if status.startswith('ERROR') else status)
+        return lines
+
+    def parse_legacy_response(self, lines):
+        for line in lines:
+            if line.startswith("Failed") or line.startswith("Not"):
+                raise SerialCommandError(line)
+        return [line for line in lines if line]
+
+def change_token(future):
+    # Marca de cambio de un directorio a partir de la respuesta a 'token'; None si no se conoce
+    if future is None:
+        return None
+    try:
+        lines = future.result()
+    except (SerialCommandError, serial.SerialException):
+        return None
+    return lines[0] if lines else None
+
+class DirectoryListing:
+    # Páginas ya recibidas de un directorio remoto; volver a mostrarlas no cuesta ninguna petición
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.complete = False
+        self.token = None  # Marca de cambio del directorio cuando se pidió la primera página
+        self.validated = 0.0  # time.monotonic() de la última vez que se comprobó contra el Arduino
+
+    def fetch_next_page(self, serial_client):
+        # Devuelve (entradas nuevas, si se volvió a empezar). La marca se pide antes que cada página:
+        # si el directorio cambia entre ambas, la siguiente validación no coincide y se vuelve a listar.
+        # Si cambió desde la primera página, los desplazamientos ya no valen: se lista desde el principio
+        token_future = serial_client.submit_change_token(self.path)
+        page, self.complete = serial_client.list_page(self.path, len(self.entries), LIST_PAGE_SIZE)
+        restarted = False
+        if token_future is not None:
+            token = change_token(token_future)
+            if self.entries and token != self.token:
+                self.entries = []
+                restarted = True
+                page, self.complete = serial_client.list_page(self.path, 0, LIST_PAGE_SIZE)
+            if not self.entries:
+                self.token = token
+                self.validated = time.monotonic()
+        # Sin marcas de cambio, un cambio entre páginas desplaza las entradas: no se repiten nombres
+        names = {entry[1] for entry in self.entries}
+        page = [entry for entry in page if entry[1] not in names]
+        self.entries.extend(page)
+        return page, restarted
+
+    # Actualizaciones locales tras nuestras propias órdenes; solo valen para listados completos,
+    # en uno parcial desplazarían las páginas que faltan por pedir
+    def add_entry(self, entry):
+        self.entries.append(entry)
+
+    def remove_entry(self, name):
+        self.entries = [entry for entry in self.entries if entry[1] != name]
+
+    def rename_entry(self, old_name, new_name):
+        self.entries = [(entry_type, new_name if name == old_name else name, size, modified)
+                        for entry_type, name, size, modified in self.entries]
+
+class RemoteDirectoryCache:
+    # Listados remotos por ruta, los menos usados se descartan primero
+    def __init__(self):
+        self.listings = OrderedDict()
+
+    def get(self, path):
+        listing = self.listings.get(path)
+        if listing is not None:
+            self.listings.move_to_end(path)
+        return listing
+
+    def put(self, listing):
+        self.listings[listing.path] = listing
+        self.listings.move_to_end(listing.path)
+        while len(self.listings) > REMOTE_CACHE_MAX_DIRECTORIES:
+            self.listings.popitem(last=False)
+
+    def subtree(self, path):
+        prefix = os.path.join(path, '')
+        return [key for key in self.listings if key == path or key.startswith(prefix)]
+
+    def discard(self, path):
+        self.listings.pop(path, None)
+
+    def discard_tree(self, path):
+        for key in self.subtree(path):
+            del self.listings[key]
+
+    def move_tree(self, old_path, new_path):
+        for key in self.subtree(old_path):
+            listing = self.listings.pop(key)
+            listing.path = new_path + key[len(old_path):]
+            self.listings[listing.path] = listing
+
+class FramedSerial:
+    # Peticiones de una línea con respuestas enmarcadas. El firmware responde con las líneas de
+    # datos, una línea de estado ('OK' o 'ERROR <mensaje>') y la marca RESPONSE_END, así que se
+    # lee exactamente lo que llega, sin esperas fijas y sin cortar respuestas largas.
+    # Con firmware antiguo, sin marca de fin, la respuesta termina tras RESPONSE_IDLE_SECONDS sin datos.
+    def __init__(self, port):
+        self.client = SerialClient(port)
+        self.binary = None  # Protocolo de listados; se negocia en la primera petición
+        self.paged = False
+        self.tokens = False
+        self.binary_lock = Lock()  # Un solo listado binario a la vez: sus tramas no llevan id
+
+    def submit(self, command):
+        # Devuelve un Future con las líneas de datos de la respuesta
+        if self.binary is None:
+            self.negotiate()
+        return self.client.submit(command)
+
+    def request(self, command):
+        return self.submit(command).result()
+
+    def negotiate(self):
+        # 'proto' siempre va sin id. El firmware nuevo responde con sus capacidades:
+        # 'BIN <versión>' para el protocolo binario, 'IDS' si acepta peticiones con id
+        # 'PAGE' si 'list' y 'blist' aceptan '<desplazamiento> <cantidad>' antes de la ruta
+        # y 'TOKEN' si 'token <ruta>' devuelve una marca que cambia con cada cambio del directorio
+        try:
+            response = self.client.submit("proto").result()
+        except SerialCommandError:
+            response = []
+        self.binary = f"BIN {BINARY_PROTOCOL_VERSION}" in response
+        self.client.tagged = "IDS" in response
+        self.paged = "PAGE" in response
+        self.tokens = "TOKEN" in response
+        # Si ni 'proto' se cerró con RESPONSE_END, el firmware es antiguo y las órdenes sin
+        # respuesta terminan tras RESPONSE_IDLE_SECONDS en lugar de RESPONSE_TIMEOUT_SECONDS
+        self.client.legacy = not self.client.framed
+
+    def submit_change_token(self, path):
+        # Future con la respuesta a 'token'; None si el firmware no tiene marcas de cambio
+        if self.binary is None:
+            self.negotiate()
+        return self.submit(f"token {path}") if self.tokens else None
+
+    def list_directory(self, path):
+        return self.list_entries(path)
+
+    def list_page(self, path, offset, count):
+        # Devuelve (entradas, completo); una página con menos de 'count' entradas es la última
+        if self.binary is None:
+            self.negotiate()
+        if not self.paged:
+            return self.list_directory(path), True  # Firmware sin páginas: el directorio entero de una vez
+        entries = self.list_entries(f"{offset} {count} {path}")
+        return entries, len(entries) < count
+
+    def list_entries(self, arguments):
+        # Devuelve [(tipo, nombre, tamaño, fecha)] con el protocolo acordado con el firmware
+        if self.binary is None:
+            self.negotiate()
+        if not self.binary:
+            return [entry for entry in map(parse_text_entry, self.request(f"list {arguments}")) if entry is not None]
+        return [('DIR' if is_dir else 'FILE', name, str(size), time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(mtime)))
+                for is_dir, name, size, mtime in self.request_binary_listing(arguments)]
+
+    def request_binary_listing(self, arguments):
+        with self.binary_lock:
+            while not self.client.frames.empty():
+                self.client.frames.get_nowait()  # Restos de un listado anterior abandonado
+            self.client.binary_active.set()
+            try:
+                return self.receive_binary_listing(arguments)
+            finally:
+                self.client.binary_active.clear()
+
+    def receive_binary_listing(self, arguments):
+        # 'blist' no espera respuesta de texto: sus tramas llegan por la cola del lector.
+        # El id 0 no se asigna a ninguna petición de texto
+        self.client.write((f"0 blist {arguments}\n" if self.client.tagged else f"blist {arguments}\n").encode())
+        entries = []
+        expected_seq = 0
+        failures = 0
+        while True:
+            try:
+                # Más que el plazo del lector para una trama: sus errores llegan antes que este
+                frame = self.client.frames.get(timeout=2 * FRAME_TIMEOUT_SECONDS)
+            except queue.Empty:
+                frame = FrameError("Tiempo de espera agotado")
+            if isinstance(frame, serial.SerialException):
+                raise frame
+            if isinstance(frame, FrameError):
+                failures += 1
+                if failures > FRAME_MAX_RETRIES:
+                    raise SerialCommandError(f"Listado binario fallido: {frame}")
+                self.client.write(FRAME_NAK)
+                continue
+            frame_type, seq, payload = frame
+            if seq != expected_seq:
+                # Se perdió una confirmación y el firmware repitió la trama anterior
+                self.client.write(FRAME_ACK if seq == (expected_seq - 1) & 0xFF else FRAME_NAK)
+                continue
+            self.client.write(FRAME_ACK)
+            failures = 0
+            expected_seq = (expected_seq + 1) & 0xFF
+            try:
+                if frame_type == FRAME_ENTRIES:
+                    entries.extend(decode_entries(payload))
+                elif frame_type == FRAME_END:
+                    count, _ = decode_varint(payload, 0)
+                    if count != len(entries):
+                        raise SerialCommandError(f"Listado incompleto: {len(entries)} de {count} entradas")
+                    return entries
+                elif frame_type == FRAME_ERROR:
+                    raise SerialCommandError(payload.decode('utf-8', 'replace'))
+            except FrameError as e:
+                # El CRC es correcto, así que repetir la trama no serviría: el firmware la montó mal
+                raise SerialCommandError(f"Trama de listado mal formada: {e}")
 
 class FileManager(tk.Tk):
     def __init__(self, serial_port):
         super().__init__()
 
         self.serial_port = serial.Serial(serial_port, 9600, timeout=1)
+        self.serial = FramedSerial(self.serial_port)
         self.current_path = "/"
         self.history = []
         self.sort_column = "name"
         self.reverse_sort = False
         self.view_mode = 'details'  # 'details' or 'grid'
+        self.listing = DirectoryListing(self.current_path)
+        self.cache = RemoteDirectoryCache()
+        self.page_pending = False  # Hay una página pedida al desplazarse que aún no se ha cargado
 
         self.setup_toolbar()
         self.setup_views()
@@ -46,7 +530,13 @@ class FileManager(tk.Tk):
         self.container = tk.Frame(self)
         self.container.pack(fill=tk.BOTH, expand=True)
 
-        self.tree = ttk.Treeview(self.container, columns=('Size', 'Type', 'Modified'))
+        self.tree_frame = Frame(self.container)
+        self.tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree_scroll_y = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL)
+        self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree = ttk.Treeview(self.tree_frame, columns=('Size', 'Type', 'Modified'), yscrollcommand=self.on_tree_scroll)
         self.tree.heading('#0', text='Nombre', command=lambda: self.treeview_sort_column('name'))
         self.tree.heading('Size', text='Tamaño', command=lambda: self.treeview_sort_column('size'))
         self.tree.heading('Type', text='Tipo', command=lambda: self.treeview_sort_column('type'))
@@ -59,19 +549,20 @@ class FileManager(tk.Tk):
         self.tree.bind("<Double-1>", self.on_double_click)
         self.tree.pack(fill=tk.BOTH, expand=True)
 
+        self.tree_scroll_y.config(command=self.tree.yview)
+
         self.grid_frame = Frame(self.container)
         self.grid_labels = []
 
     def toggle_view(self):
         if self.view_mode == 'details':
             self.view_mode = 'grid'
-            self.tree.pack_forget()
-            self.display_grid_view()
+            self.tree_frame.pack_forget()
         else:
             self.view_mode = 'details'
             self.grid_frame.pack_forget()
-            self.tree.pack(fill=tk.BOTH, expand=True)
-        self.refresh()
+            self.tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.display_entries()  # Ambas vistas usan las páginas ya recibidas
 
     def display_grid_view(self):
         for label in self.grid_labels:
@@ -80,10 +571,9 @@ class FileManager(tk.Tk):
 
         row = 0
         column = 0
-        entries = self.get_directory_contents(self.current_path)
-        for entry in entries:
+        for entry in self.listing.entries:
             frame = Frame(self.grid_frame, borderwidth=1, relief=tk.RAISED)
-            label = Label(frame, text=entry, padx=10, pady=10)
+            label = Label(frame, text=entry[1], padx=10, pady=10)
             label.pack()
             frame.grid(row=row, column=column, sticky='nsew', padx=5, pady=5)
             self.grid_labels.append(frame)
@@ -91,11 +581,50 @@ class FileManager(tk.Tk):
             if column > 3:
                 column = 0
                 row += 1
+        if not self.listing.complete:
+            # La cuadrícula no se desplaza: las páginas siguientes se piden con este botón
+            more_button = ttk.Button(self.grid_frame, text='Cargar más', command=self.load_more_tiles)
+            more_button.grid(row=row + 1, column=0, columnspan=4, pady=5)
+            self.grid_labels.append(more_button)
         self.grid_frame.pack(fill=tk.BOTH, expand=True)
 
+    def load_more_tiles(self):
+        self.load_next_page()
+        self.display_grid_view()  # Vuelve a pintar todo el listado, también si se empezó de nuevo
+
     def refresh(self):
+        # El botón Actualizar siempre comprueba el listado guardado contra el Arduino
+        self.open_directory(revalidate=True)
+
+    def open_directory(self, revalidate=False):
         self.update_title()
         print("Refreshing content...")  # Depuración
+        listing = self.cache.get(self.current_path)
+        if listing is not None and not self.is_listing_valid(listing, revalidate):
+            listing = None
+        if listing is None:
+            listing = DirectoryListing(self.current_path)
+            self.cache.put(listing)
+        self.listing = listing
+        self.page_pending = False
+        if not listing.entries and not listing.complete:
+            self.load_next_page()  # Solo se pide la primera página; el resto llega al desplazarse
+        self.display_entries()
+
+    def is_listing_valid(self, listing, revalidate):
+        # Sin marcas de cambio en el firmware, solo nuestras órdenes modifican la tarjeta y ya se
+        # aplican al listado guardado: se usa hasta que se pulsa Actualizar
+        if not self.serial.tokens:
+            return not revalidate
+        if not revalidate and time.monotonic() - listing.validated < REMOTE_CACHE_TRUST_SECONDS:
+            return True
+        token = change_token(self.serial.submit_change_token(listing.path))
+        if token is None or token != listing.token:
+            return False
+        listing.validated = time.monotonic()
+        return True
+
+    def display_entries(self):
         if self.view_mode == 'details':
             self.load_directory_contents(self.current_path)
         elif self.view_mode == 'grid':
@@ -105,28 +634,68 @@ class FileManager(tk.Tk):
         print(f"Loading directory contents for: {path}")  # Depuración
         for item in self.tree.get_children():
             self.tree.delete(item)
-        entries = self.get_directory_contents(path)
-        print(f"Entries: {entries}")  # Depuración
-        for entry in entries:
-            entry_data = entry.split(',')
-            if len(entry_data) == 4:
-                entry_type, name, size, modified = entry_data
-                size_text = '' if entry_type == 'DIR' else f'{size} bytes'
-                self.tree.insert('', 'end', iid=name, text=name, values=(size_text, entry_type, modified))
-
-    def get_directory_contents(self, path):
-        print(f"Getting directory contents for: {path}")  # Depuración
-        self.serial_port.write(f"list {path}\n".encode())
-        time.sleep(1)
-        response = self.serial_port.read_all().decode()
-        print(f"Response from Arduino: {response}")  # Depuración
-        lines = response.split('\n')
-        entries = []
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith("Failed") and not line.startswith("Not"):
-                entries.append(line)
-        return entries
+        self.insert_entries(self.listing.entries)
+
+    def insert_entries(self, entries):
+        for entry_type, name, size, modified in entries:
+            size_text = '' if entry_type == 'DIR' else f'{size} bytes'
+            self.tree.insert('', 'end', iid=name, text=name, values=(size_text, entry_type, modified))
+
+    def load_next_page(self):
+        # Devuelve (entradas nuevas, si se volvió a empezar); tras un error se deja de pedir páginas de este listado
+        listing = self.listing
+        if listing.complete:
+            return [], False
+        try:
+            return listing.fetch_next_page(self.serial)
+        except (SerialCommandError, serial.SerialException) as e:
+            listing.complete = True
+            self.cache.discard(listing.path)  # Un listado a medias no se guarda
+            messagebox.showerror("Error", f"Error del Arduino al listar {listing.path}: {e}")
+            return [], False
+
+    def on_tree_scroll(self, first, last):
+        self.tree_scroll_y.set(first, last)
+        # También se llama al insertar filas: si la primera página no llena la vista, se pide la siguiente
+        if float(last) >= LIST_PREFETCH_FRACTION and not self.listing.complete and not self.page_pending:
+            self.page_pending = True
+            listing = self.listing
+            self.after_idle(lambda: self.load_more_rows(listing))
+
+    def load_more_rows(self, listing):
+        if listing is not self.listing:
+            return  # Se cambió de directorio antes de cargar la página
+        self.page_pending = False
+        page, restarted = self.load_next_page()
+        if self.view_mode != 'details':
+            return
+        if restarted:
+            self.load_directory_contents(listing.path)  # Las filas ya mostradas pueden no existir
+        else:
+            self.insert_entries(page)
+
+    def send_command(self, command, directory, update):
+        # Orden que modifica 'directory'. Si tiene éxito, 'update' aplica el cambio al listado
+        # guardado y la nueva marca del directorio se pide en la misma ráfaga que la orden.
+        # Si falla, se muestra el error, se descarta el listado guardado y devuelve False
+        token_future = None
+        try:
+            future = self.serial.submit(command)
+            token_future = self.serial.submit_change_token(directory)
+            future.result()
+        except (SerialCommandError, serial.SerialException) as e:
+            self.cache.discard(directory)  # No se sabe qué llegó a cambiar
+            messagebox.showerror("Error", f"Error del Arduino en «{command}»: {e}")
+            return False
+        listing = self.cache.get(directory)
+        if listing is not None:
+            if listing.complete:
+                update(listing)
+                listing.token = change_token(token_future)
+                listing.validated = time.monotonic()
+            else:
+                self.cache.discard(directory)
+        return True
 
     def show_context_menu(self, event):
         iid = self.tree.identify_row(event.y)
@@ -146,20 +715,20 @@ class FileManager(tk.Tk):
             if entry_type == 'DIR':
                 self.history.append(self.current_path)
                 self.current_path = os.path.join(self.current_path, path)
-                self.refresh()
+                self.open_directory()
 
     def go_back(self):
         if self.history:
             self.current_path = self.history.pop()
-            self.refresh()
+            self.open_directory()
 
     def create_folder(self):
         new_folder_name = simpledialog.askstring("Crear Carpeta", "Nombre de la nueva carpeta:")
         if new_folder_name:
             new_folder_path = os.path.join(self.current_path, new_folder_name)
-            self.serial_port.write(f"mkdir {new_folder_path}\n".encode())
-            time.sleep(1)  # Esperar para que el Arduino procese el comando
-            self.refresh()
+            entry = ('DIR', new_folder_name, '0', time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+            self.send_command(f"mkdir {new_folder_path}", self.current_path, lambda listing: listing.add_entry(entry))
+            self.open_directory()
 
     def rename(self):
         item = self.tree.selection()[0]
@@ -168,9 +737,10 @@ class FileManager(tk.Tk):
         if new_name and new_name != old_name:
             old_path = os.path.join(self.current_path, old_name)
             new_path = os.path.join(self.current_path, new_name)
-            self.serial_port.write(f"rename {old_path} {new_path}\n".encode())
-            time.sleep(1)  # Esperar para que el Arduino procese el comando
-            self.refresh()
+            if self.send_command(f"rename {old_path} {new_path}", self.current_path,
+                                 lambda listing: listing.rename_entry(old_name, new_name)):
+                self.cache.move_tree(old_path, new_path)
+            self.open_directory()
 
     def delete(self):
         item = self.tree.selection()[0]
@@ -178,9 +748,9 @@ class FileManager(tk.Tk):
         response = messagebox.askyesno("Eliminar", "¿Estás seguro de querer eliminar esto?")
         if response:
             path = os.path.join(self.current_path, name)
-            self.serial_port.write(f"delete {path}\n".encode())
-            time.sleep(1)  # Esperar para que el Arduino procese el comando
-            self.refresh()
+            if self.send_command(f"delete {path}", self.current_path, lambda listing: listing.remove_entry(name)):
+                self.cache.discard_tree(path)
+            self.open_directory()
 
     def treeview_sort_column(self, col):
         self.reverse_sort = not self.reverse_sort
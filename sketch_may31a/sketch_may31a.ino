@@ -30,29 +30,66 @@ void loop() {
   }
 }
 
+// Petición en curso con formato '<id> <comando>\n'; el id se repite en la respuesta
+char requestId[8];
+int requestIdLength = 0;
+bool readingRequest = false;
+
 void handleSerialInput() {
-  if (Serial.available() > 0) {
-    char command = Serial.read();
-    if (command == 'H') {
-      digitalWrite(ledPin, HIGH); // Enciende el LED
-    } else if (command == 'L') {
-      digitalWrite(ledPin, LOW); // Apaga el LED
-    } else if (command == 'C') {
-      if (digitalRead(buttonPin) == LOW) {
-        Serial.write('1'); // Envía '1' si el botón en el pin 3 está presionado
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (!readingRequest) {
+      if (isDigit(c)) {
+        readingRequest = true; // Empieza una petición con id
+        requestIdLength = 0;
+        requestId[requestIdLength++] = c;
+      } else if (c != '\r' && c != '\n') {
+        // Comando de un solo byte sin id (protocolo anterior)
+        int result = runCommand(c);
+        if (result >= 0) {
+          Serial.write(result ? '1' : '0');
+        }
+      }
+    } else if (isDigit(c)) {
+      if (requestIdLength < (int)sizeof(requestId) - 1) {
+        requestId[requestIdLength++] = c;
+      }
+    } else if (c == ' ') {
+      requestId[requestIdLength] = '\0';
+      while (Serial.available() == 0) {} // El comando sigue al espacio
+      char command = Serial.read();
+      int result = runCommand(command);
+      Serial.print(requestId);
+      Serial.print(' ');
+      if (result >= 0) {
+        Serial.println(result ? '1' : '0');
       } else {
-        Serial.write('0'); // Envía '0' si el botón en el pin 3 no está presionado
+        Serial.println("OK");
       }
-    } else if (command == 'P') {
-      led2_state = true;
-      digitalWrite(led2Pin, HIGH); // Enciende el LED del pin 2
-    } else if (command == 'Q') {
-      led2_state = false;
-      digitalWrite(led2Pin, LOW); // Apaga el LED del pin 2
+    } else if (c == '\n') {
+      readingRequest = false; // Fin de la petición
     }
   }
 }
 
+// Ejecuta un comando; devuelve el estado del botón para 'C' y -1 para el resto
+int runCommand(char command) {
+  if (command == 'H') {
+    digitalWrite(ledPin, HIGH); // Enciende el LED
+  } else if (command == 'L') {
+    digitalWrite(ledPin, LOW); // Apaga el LED
+  } else if (command == 'C') {
+    return digitalRead(buttonPin) == LOW ? 1 : 0; // 1 si el botón en el pin 3 está presionado
+  } else if (command == 'P') {
+    led2_state = true;
+    digitalWrite(led2Pin, HIGH); // Enciende el LED del pin 2
+  } else if (command == 'Q') {
+    led2_state = false;
+    digitalWrite(led2Pin, LOW); // Apaga el LED del pin 2
+  }
+  return -1;
+}
+
 void updateLed2State() {
   if (led2_state) {
     digitalWrite(led2Pin, HIGH); // Mantiene el LED del pin 2 encendido